@@ -0,0 +1,63 @@
+"""
+Local stand-in for the chat completions API, for tests and benchmarks that
+should not pay for (or wait on) real LLM calls.
+
+Usage, from the fastapi directory:
+    FAKE_LLM_LATENCY=0.5 uvicorn benchmarks.fake_llm_server:app --port 8100
+and run the API with LLM_BASE_URL=http://127.0.0.1:8100/v1
+"""
+import asyncio
+import json
+import os
+import re
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Seconds each completion takes, to mimic provider round trips
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+
+app = FastAPI()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(FAKE_LLM_LATENCY)
+    prompt = " ".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for message in body["messages"]
+        for part in (message["content"] if isinstance(message["content"], list) else [message["content"]])
+    )
+    # Answer batched frame prompts in the format the caller parses
+    frame_count = re.search(r"You are given (\d+) frames", prompt)
+    if frame_count:
+        content = "\n".join(f"Frame {i}: A placeholder description." for i in range(1, int(frame_count.group(1)) + 1))
+    else:
+        content = "A placeholder summary."
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = min(len(content) // 4, body.get("max_tokens", 600))
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(body, content, usage), media_type="text/event-stream")
+    return {
+        "object": "chat.completion",
+        "model": body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
+
+
+async def stream_chunks(body: dict, content: str, usage: dict):
+    """Send the answer word by word, the way streamed completions arrive."""
+    for word in re.findall(r"\S+\s*", content):
+        chunk = {"object": "chat.completion.chunk", "model": body["model"], "choices": [{"index": 0, "delta": {"content": word}}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(0.01)
+    if body.get("stream_options", {}).get("include_usage"):
+        yield f"data: {json.dumps({'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
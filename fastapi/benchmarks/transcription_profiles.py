@@ -0,0 +1,44 @@
+"""
+Measure the real-time factor (decode time / media duration) of every
+transcription profile on this machine.
+
+Usage, from the fastapi directory:
+    python -m benchmarks.transcription_profiles path/to/audio.mp3 [more files...]
+
+An RTF below 1.0 means the profile transcribes faster than real time.
+"""
+import sys
+import time
+
+from faster_whisper import decode_audio
+
+from utilities.whisper_models import TRANSCRIPTION_PROFILES, get_model_pool, get_transcription_profile, iter_transcription
+
+
+def benchmark(audio_paths: list, profiles: list):
+    results = []
+    for profile in profiles:
+        options = get_transcription_profile(profile)
+        # Load outside of the timed section; requests get warm models from the pool
+        get_model_pool(options["model_size"], options["compute_type"], options["cpu_threads"]).warm()
+        for audio_path in audio_paths:
+            duration = len(decode_audio(audio_path)) / 16000
+            started = time.perf_counter()
+            segments = list(iter_transcription(audio_path, **options))
+            elapsed = time.perf_counter() - started
+            results.append((profile, audio_path, duration, elapsed, len(segments)))
+            print(f"{profile:<10} {audio_path}: {duration:.1f}s audio in {elapsed:.1f}s, RTF {elapsed / duration:.3f}")
+
+    print("\nprofile     audio(s)   decode(s)   RTF")
+    for profile in profiles:
+        rows = [r for r in results if r[0] == profile]
+        total_audio = sum(r[2] for r in rows)
+        total_elapsed = sum(r[3] for r in rows)
+        print(f"{profile:<10} {total_audio:>9.1f} {total_elapsed:>11.1f} {total_elapsed / total_audio:>7.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    benchmark(sys.argv[1:], list(TRANSCRIPTION_PROFILES))
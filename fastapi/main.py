@@ -12,6 +12,9 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 import utilities.auth as auth 
 from utilities.auth import get_current_user
 from utilities.logger import log_user_activity, DISCORD_WEBHOOK_URL
+from utilities.whisper_models import preload_models
+from utilities.inference_client import inference_server_enabled
+from utilities.llm_client import close_client
 
 # from tools.youtube_download_transcribe_media import router as tm_router
 # from tools.bulk_image_compressor import router as bic_router
@@ -27,7 +30,7 @@ from tools.downloader import router as dl_router
 
 from tools.audio_video_separator import router as av_router
 from tools.transcribe_media import router as tm_router 
-# from tools.token_counter import router as tc_router
+from tools.token_counter import router as tc_router
 from tools.summarize_transcript import router as st_router
 from tools.summarize_video import router as sv_router
 from tools.summarize_transcript_and_video import router as stv_router
@@ -61,7 +64,7 @@ app.include_router(av_router, prefix="/tools")
 
 # app.include_router(id_router, prefix="/tools") 
 app.include_router(tm_router, prefix="/tools") 
-# app.include_router(tc_router, prefix="/tools") 
+app.include_router(tc_router, prefix="/tools") 
 app.include_router(st_router, prefix="/tools") 
 app.include_router(sv_router, prefix="/tools") 
 app.include_router(stv_router, prefix="/tools") 
@@ -84,6 +87,13 @@ PROCESSED_DIR = "processed"
 def on_startup():
     if not os.path.exists(PROCESSED_DIR):
         os.makedirs(PROCESSED_DIR)
+    # With a shared inference server the models live there, not in every worker
+    if not inference_server_enabled():
+        preload_models()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await close_client()
 
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,56 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from utilities import llm_client
+
+RESULT = {
+    "model": "gpt-4",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class FlakyClient:
+    """Raises a transport error for the first `failures` posts, then answers."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def post(self, url, json):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise httpx.ConnectTimeout("timed out")
+        return httpx.Response(200, json=RESULT)
+
+
+@pytest.fixture
+def flaky_client(monkeypatch):
+    def install(failures: int) -> FlakyClient:
+        client = FlakyClient(failures)
+        monkeypatch.setattr(llm_client, "get_client", lambda: client)
+        monkeypatch.setattr(llm_client, "backoff_delay", lambda attempt: 0)
+        monkeypatch.setattr(llm_client.llm_cache, "put", lambda key, result: None)
+        return client
+    return install
+
+
+def complete():
+    return asyncio.run(llm_client.chat_completion("gpt-4", [{"role": "user", "content": "hi"}], 10, 0, use_cache=False))
+
+
+def test_chat_completion_retries_transport_errors(flaky_client):
+    client = flaky_client(failures=2)
+    assert complete() == RESULT
+    assert client.calls == 3
+
+
+def test_chat_completion_gives_up_with_504(flaky_client):
+    client = flaky_client(failures=llm_client.LLM_MAX_RETRIES + 1)
+    with pytest.raises(HTTPException) as raised:
+        complete()
+    assert raised.value.status_code == 504
+    assert client.calls == llm_client.LLM_MAX_RETRIES + 1
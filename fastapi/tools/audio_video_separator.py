@@ -4,12 +4,15 @@ from fastapi.responses import FileResponse
 from moviepy.editor import VideoFileClip
 import os
 from pathlib import Path
+import shutil
 import zipfile
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
 from utilities.auth import get_current_user
 from utilities.logger import log_user_activity
-from .instagram_downloader import download_instagram_content_for_processing
+from utilities.media_cache import CachedMedia, canonical_source_id, canonical_url, media_cache, source_dir_name
+from .instagram_downloader import download_instagram_content_util
 from .youtube_downloader import download_youtube_video_util
 
 router = APIRouter()
@@ -31,7 +34,7 @@ async def extract_and_package_media(
     if source_type == "unsupported":
         raise HTTPException(status_code=400, detail="Unsupported URL type provided.")
 
-    audio_path, content_dir = extract_audio(source_url, source_type, PROCESSED_DIR)
+    audio_path, content_dir = await run_in_threadpool(extract_audio, source_url, source_type, PROCESSED_DIR)
     
     # Create a zip file of the content directory
     zip_file_path = os.path.join(PROCESSED_DIR, f"{Path(content_dir).stem}.zip")
@@ -53,28 +56,79 @@ def determine_source_type(url: str) -> str:
         return "youtube"
     return "unsupported"
 
-def extract_audio(url: str, source_type: str, output_dir: str) -> str:
-    if source_type == "youtube":
-        return extract_audio_from_youtube(url, output_dir)
-    elif source_type == "instagram":
-        return extract_audio_from_instagram(url, output_dir)
+def fetch_source_video(source_id: str, output_dir: str) -> CachedMedia:
+    """
+    Link a YouTube source's video from the shared media cache to
+    `output_dir/<platform>_<id>/<platform>_<id>.mp4`, downloading it on a miss.
+    """
+    name = source_dir_name(source_id)
+    return media_cache.fetch(
+        source_id,
+        lambda scratch: download_youtube_video_util(canonical_url(source_id), scratch)["video_path"],
+        os.path.join(output_dir, name, f"{name}.mp4"),
+    )
 
-def extract_audio_from_youtube(url: str, output_dir: str) -> (str, str):
-    download_info = download_youtube_video_util(url, output_dir)
-    video_path = download_info["video_path"]
-    video_dir = Path(video_path).parent  # This will be the directory containing the video file.
-    clip = VideoFileClip(video_path)
-    audio_path = video_path.replace(".mp4", ".mp3")
-    clip.audio.write_audiofile(audio_path)
-    return audio_path, str(video_dir)  # Return both the audio path and the directory.
+def fetch_instagram_archive(source_id: str, output_dir: str) -> CachedMedia:
+    """
+    Link the zip of an Instagram post's media and caption from the shared media
+    cache to `output_dir/<shortcode>.zip`, downloading it on a miss.
+    """
+    shortcode = source_id.split(":", 1)[1]
+    return media_cache.fetch(
+        source_id,
+        lambda scratch: download_instagram_content_util(canonical_url(source_id), shortcode, scratch),
+        os.path.join(output_dir, f"{shortcode}.zip"),
+        variant="archive",
+    )
+
+def unpack_archive(archive: CachedMedia, content_dir: str) -> list:
+    """
+    Extract the files of a cached archive into `content_dir`, skipping those
+    already there. Extracted files are tracked by the cache, which renews their
+    lease on every call, and go with the archive.
+    """
+    os.makedirs(content_dir, exist_ok=True)
+    paths = []
+    with zipfile.ZipFile(archive.path) as zipf:
+        for member in zipf.infolist():
+            if member.is_dir():
+                continue
+            path = os.path.join(content_dir, Path(member.filename).name)
+            if not os.path.exists(path):
+                staged = f"{path}.tmp"
+                with zipf.open(member) as src, open(staged, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(staged, path)
+            media_cache.track(path, archive.content_hash)
+            paths.append(path)
+    return sorted(paths)
+
+def download_media(url: str, source_type: str, output_dir: str) -> (str, str):
+    """
+    Fetch the source video without touching its audio. Transcription reads
+    the audio track straight from the returned MP4, so no MP3 is produced here.
+    Media comes from the shared media cache, so each source is downloaded once;
+    outputs go to a directory named after the source ID rather than its title.
+    Instagram posts are unpacked there whole, captions and images included.
+    """
+    source_id = canonical_source_id(url)
+    if source_id is None:
+        raise HTTPException(status_code=400, detail="Unrecognized YouTube or Instagram URL.")
+    content_dir = os.path.join(output_dir, source_dir_name(source_id))
+    if source_id.startswith("instagram:"):
+        files = unpack_archive(fetch_instagram_archive(source_id, output_dir), content_dir)
+        video_files = [path for path in files if path.endswith(".mp4")]
+        if not video_files:
+            raise Exception("No video file found in downloaded Instagram content.")
+        video_path = video_files[0]
+    else:
+        video_path = fetch_source_video(source_id, output_dir).path
+    return video_path, content_dir  # Return both the video path and the directory.
 
-def extract_audio_from_instagram(url: str, output_dir: str) -> (str, str):
-    content_dir, _ = download_instagram_content_for_processing(url, output_dir)
-    video_files = list(Path(content_dir).glob("*.mp4"))
-    if not video_files:
-        raise Exception("No video file found in downloaded Instagram content.")
-    video_path = str(video_files[0])
+def extract_audio(url: str, source_type: str, output_dir: str) -> (str, str):
+    """Download the source video and write its audio track to an MP3 next to it."""
+    video_path, content_dir = download_media(url, source_type, output_dir)
     clip = VideoFileClip(video_path)
-    audio_path = os.path.join(content_dir, Path(video_path).stem + ".mp3")
+    audio_path = str(Path(video_path).with_suffix(".mp3"))
     clip.audio.write_audiofile(audio_path)
     return audio_path, content_dir  # Return both the audio path and the directory.
@@ -21,15 +21,16 @@ PROCESSED_DIR = "processed"
 # Configure Instaloader for a wider range of content
 L = instaloader.Instaloader(download_pictures=True, download_videos=True, download_video_thumbnails=True, download_comments=False, save_metadata=True, post_metadata_txt_pattern='')
 
-def download_instagram_content_util(content_url, shortcode):
+def download_instagram_content_util(content_url, shortcode, output_dir=PROCESSED_DIR):
     """
     Downloads Instagram content to a directory named after the shortcode and creates a zip file.
     
     :param content_url: The full URL of the Instagram content to download.
     :param shortcode: The shortcode extracted from the content URL.
+    :param output_dir: The directory the content directory and zip file are created in.
     :return: Path to the created zip file.
     """
-    content_specific_dir = os.path.join(PROCESSED_DIR, shortcode)
+    content_specific_dir = os.path.join(output_dir, shortcode)
     os.makedirs(content_specific_dir, exist_ok=True)  # Ensure the directory exists
     
     try:
@@ -40,7 +41,7 @@ def download_instagram_content_util(content_url, shortcode):
         with open(caption_file_path, "w", encoding="utf-8") as f:
             f.write(post.caption if post.caption else "No caption")
 
-        zip_file_path = os.path.join(PROCESSED_DIR, f"{shortcode}.zip")
+        zip_file_path = os.path.join(output_dir, f"{shortcode}.zip")
         with zipfile.ZipFile(zip_file_path, 'w') as zipf:
             for item in Path(content_specific_dir).iterdir():
                 if item.is_file():
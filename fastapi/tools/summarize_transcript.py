@@ -1,22 +1,47 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import openai
 from dotenv import load_dotenv
+from typing import List, Optional
+import asyncio
+import math
 import os
+import re
 from sqlalchemy.orm import Session
 
 
 from tools.transcribe_media import process_media_transcription, determine_source_type
-from tools.token_counter import calculate_token_count
+from utilities.whisper_models import DEFAULT_TRANSCRIPTION_PROFILE, TranscriptionProfile
+from tools.token_counter import (
+    calculate_token_count,
+    calculate_token_counts,
+    estimate_usage,
+    template_token_count,
+    truncate_to_tokens,
+)
 
-from database import get_db 
+from database import SessionLocal, get_db 
 from utilities.auth import get_current_user
 from utilities.increment_ai_api_counter import increment_ai_api_counter
+from utilities.llm_client import chat_completion, completion_text, get_usage_stats, stream_chat_completion
+from utilities.llm_cache import llm_cache
+from utilities.sse import format_sse
+from utilities.extractive_summary import extractive_summary, validate_summary_mode
+from utilities.media_probe import estimate_transcript_tokens, probe_media
+from utilities.quote_store import quote_store
 
 router = APIRouter()
 load_dotenv()  # Load environment variables from .env file
 
-openai.api_key = os.getenv("OPENAI_API_KEY")  # Set your OpenAI API key
+SUMMARY_MODEL = "gpt-4"
+SUMMARY_CONTEXT_TOKENS = 8192
+SUMMARY_RESPONSE_TOKENS = 600
+# Largest transcript summarized in a single request; leaves room for the prompt and response
+SINGLE_PASS_MAX_TOKENS = SUMMARY_CONTEXT_TOKENS - SUMMARY_RESPONSE_TOKENS - 200
+# Longer transcripts are split into chunks of this size and summarized in parallel
+TRANSCRIPT_CHUNK_TOKENS = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", "3000"))
+CHUNK_SUMMARY_TOKENS = 300
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))
 
 
 class TranscriptProcessRequest(BaseModel):
@@ -24,6 +49,12 @@ class TranscriptProcessRequest(BaseModel):
     confirm_summary: bool = (
         False  # Indicates whether the user confirms summarization after seeing the token count
     )
+    profile: TranscriptionProfile = DEFAULT_TRANSCRIPTION_PROFILE
+    use_cache: bool = True  # Set to False to bypass cached LLM responses
+    mode: str = "llm"  # "llm", or "local" for an extractive summary made without any LLM call
+    precise_estimate: bool = False  # Transcribe before quoting instead of estimating from metadata
+    quote_id: Optional[str] = None  # From a precise estimate; lets the confirmed request reuse its transcript
+    token_budget: Optional[int] = None  # Trim the transcript so the whole summary fits this many tokens
 
 
 class TranscriptProcessResponse(BaseModel):
@@ -32,31 +63,110 @@ class TranscriptProcessResponse(BaseModel):
     summary: str = (
         ""  # This will contain the summary if the user confirms the summarization process
     )
+    quote_id: Optional[str] = None  # Pass back with confirm_summary to skip transcription
 
 
-async def summarize_text(transcript: str) -> str:
+def build_summary_prompt(transcript: str) -> str:
+    return f"""
+        Construct a structured summary of the video based on the audio transcription:\n{transcript}
+        """
+
+
+def build_chunk_prompt(chunk: str, part: int, parts: int) -> str:
+    return f"""
+        Summarize part {part} of {parts} of a video's audio transcription. Keep every key point, name, number and event in order, as concise notes:\n{chunk}
+        """
+
+
+def build_reduce_prompt(partial_summaries: List[str]) -> str:
+    parts = "\n\n".join(f"Part {i + 1}: {summary}" for i, summary in enumerate(partial_summaries))
+    return f"""
+        Construct a structured summary of the video based on these summaries of consecutive parts of its audio transcription:\n{parts}
+        """
+
+
+def split_transcript(transcript: str, max_tokens: int = TRANSCRIPT_CHUNK_TOKENS) -> List[str]:
+    """
+    Split a transcript into chunks of at most `max_tokens`, breaking between
+    sentences where possible and between words otherwise.
+    """
+    chunks, current, current_tokens = [], [], 0
+    sentences = re.split(r"(?<=[.!?])\s+", transcript.strip())
+    for sentence, sentence_tokens in zip(sentences, calculate_token_counts(sentences)):
+        pieces, piece_tokens = [sentence], [sentence_tokens]
+        if sentence_tokens > max_tokens:
+            pieces = sentence.split()
+            piece_tokens = calculate_token_counts(pieces)
+        for piece, tokens in zip(pieces, piece_tokens):
+            tokens += 1
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def plan_transcript_chunks(transcript: str, transcript_tokens: Optional[int] = None) -> List[str]:
+    """One chunk when the transcript fits a single request, otherwise map-reduce chunks."""
+    if transcript_tokens is None:
+        transcript_tokens = calculate_token_count(transcript)
+    if transcript_tokens <= SINGLE_PASS_MAX_TOKENS:
+        return [transcript]
+    return split_transcript(transcript)
+
+
+async def complete_summary_prompt(prompt: str, max_tokens: int, use_cache: bool) -> str:
+    params = {
+        "model": SUMMARY_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": 0,
+    }
+    result = await chat_completion(**params, use_cache=use_cache)
+    print(result)
+    return completion_text(result)
+
+
+async def prepare_summary_prompt(transcript: str, use_cache: bool = True) -> str:
+    """
+    Return the prompt for the final summary request. Transcripts too long for
+    one request are summarized in chunks concurrently first, and the prompt
+    then asks for a reduction of those partial summaries.
+    """
+    chunks = plan_transcript_chunks(transcript)
+    if len(chunks) == 1:
+        return build_summary_prompt(transcript)
+
+    slots = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize_chunk(chunk: str, part: int, parts: int) -> str:
+        async with slots:
+            return await complete_summary_prompt(build_chunk_prompt(chunk, part, parts), CHUNK_SUMMARY_TOKENS, use_cache)
+
+    partial_summaries = await asyncio.gather(
+        *[summarize_chunk(chunk, i + 1, len(chunks)) for i, chunk in enumerate(chunks)]
+    )
+    # Very long inputs can leave more partial summaries than fit one request; fold them again
+    while calculate_token_count(build_reduce_prompt(partial_summaries)) > SINGLE_PASS_MAX_TOKENS:
+        groups = split_transcript("\n\n".join(partial_summaries))
+        partial_summaries = await asyncio.gather(
+            *[summarize_chunk(group, i + 1, len(groups)) for i, group in enumerate(groups)]
+        )
+    return build_reduce_prompt(partial_summaries)
+
+
+async def summarize_text(transcript: str, use_cache: bool = True) -> str:
     """
     Summarize the provided transcript using GPT-4 without offering a model choice.
-    This function assumes you have a valid OpenAI API key.
     """
     try:
-        prompt = f"""
-        Construct a structured summary of the video based on the audio transcription:\n{transcript}
-        """
-        prompt_message = {
-            "role": "user",
-            "content": prompt,
-        }
-        params = {
-            "model": "gpt-4",
-            "messages": [prompt_message],
-            "max_tokens": 600,
-            "temperature": 0,
-        }
-        result = openai.ChatCompletion.create(**params)
-        print(result)
-        summary = result.choices[0].message.content
-        return summary
+        prompt = await prepare_summary_prompt(transcript, use_cache)
+        return await complete_summary_prompt(prompt, SUMMARY_RESPONSE_TOKENS, use_cache)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to summarize the text: {str(e)}"
@@ -64,25 +174,80 @@ async def summarize_text(transcript: str) -> str:
 
 
 # Define a function to calculate the total tokens, including the prompt and summary
+# The transcript is encoded once; prompt templates are counted separately and cached
 async def total_prompt_transcript_token_count(transcript: str) -> int:
-    # Calculate the tokens for the given transcript
-    # transcript_tokens = calculate_token_count(transcript)
+    transcript_tokens = calculate_token_count(transcript)
+    chunks = plan_transcript_chunks(transcript, transcript_tokens)
+    if len(chunks) == 1:
+        # Calculate the tokens for the prompt, plus the maximum response size
+        return transcript_tokens + template_token_count(build_summary_prompt("")) + SUMMARY_RESPONSE_TOKENS
+
+    # One call per chunk, then one reduce call over the chunk summaries
+    total_transcript_tokens = 0
+    for i, chunk_tokens in enumerate(calculate_token_counts(chunks)):
+        total_transcript_tokens += chunk_tokens + template_token_count(build_chunk_prompt("", i + 1, len(chunks)))
+        total_transcript_tokens += CHUNK_SUMMARY_TOKENS
+    total_transcript_tokens += template_token_count(build_reduce_prompt([""] * len(chunks)))
+    total_transcript_tokens += len(chunks) * CHUNK_SUMMARY_TOKENS + SUMMARY_RESPONSE_TOKENS
+    return total_transcript_tokens
 
-    # Define the prompt used for the summarization
-    prompt = f"""
-    Construct a structured summary of the video based on the audio transcription:\n{transcript}
-    """
-    # Calculate the tokens for the prompt
-    prompt_tokens = calculate_token_count(prompt)
 
-    # Add 600 tokens to account for the maximum response size
-    max_response_tokens = 600
+def estimate_prompt_transcript_token_count(transcript_tokens: int) -> int:
+    """
+    Price the summary of a transcript of about `transcript_tokens` tokens without
+    having the transcript, following the same plan as the exact count.
+    """
+    if transcript_tokens <= SINGLE_PASS_MAX_TOKENS:
+        return transcript_tokens + template_token_count(build_summary_prompt("")) + SUMMARY_RESPONSE_TOKENS
 
-    # Sum up the tokens
-    total_transcript_tokens = prompt_tokens + max_response_tokens
+    parts = math.ceil(transcript_tokens / TRANSCRIPT_CHUNK_TOKENS)
+    total_transcript_tokens = transcript_tokens
+    total_transcript_tokens += parts * (template_token_count(build_chunk_prompt("", parts, parts)) + CHUNK_SUMMARY_TOKENS)
+    total_transcript_tokens += template_token_count(build_reduce_prompt([""] * parts))
+    total_transcript_tokens += parts * CHUNK_SUMMARY_TOKENS + SUMMARY_RESPONSE_TOKENS
     return total_transcript_tokens
 
 
+def transcript_tokens_within_budget(token_budget: int) -> int:
+    """Longest transcript, in tokens, whose summary plan fits `token_budget`."""
+    if estimate_prompt_transcript_token_count(0) > token_budget:
+        minimum = estimate_prompt_transcript_token_count(0)
+        raise HTTPException(status_code=400, detail=f"Token budget too small; a summary needs at least {minimum} tokens.")
+    low, high = 0, token_budget
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_prompt_transcript_token_count(middle) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def fit_transcript_to_budget(transcript: str, token_budget: Optional[int]) -> str:
+    if token_budget is None:
+        return transcript
+    return truncate_to_tokens(transcript, transcript_tokens_within_budget(token_budget))
+
+
+def transcript_quote_params(request: TranscriptProcessRequest) -> dict:
+    """The request fields a quote's transcript depends on."""
+    return {"source_url": request.source_url, "profile": request.profile}
+
+
+async def resolve_transcription(request: TranscriptProcessRequest, source_type: str, user: dict) -> str:
+    """Reuse the transcript of a valid quote, or transcribe the media."""
+    if request.quote_id:
+        quote = await asyncio.to_thread(
+            quote_store.redeem, request.quote_id, user["id"], "transcript", transcript_quote_params(request)
+        )
+        if quote is not None:
+            return quote["transcript"]
+    transcription, _ = await process_media_transcription(
+        request.source_url, source_type, request.profile
+    )
+    return transcription
+
+
 @router.post("/audio-summary/", tags=["Summarize Audio from a Video"])
 async def audio_summary(
     request: TranscriptProcessRequest, 
@@ -92,19 +257,118 @@ async def audio_summary(
     source_type = determine_source_type(request.source_url)
     if source_type == "unsupported":
         raise HTTPException(status_code=400, detail="Unsupported URL type provided.")
+    validate_summary_mode(request.mode)
 
-    transcription, _ = await process_media_transcription(
-        request.source_url, source_type
-    )
+    if request.mode == "llm" and not request.confirm_summary and not request.precise_estimate:
+        # Quote from the source's duration; the transcript comes with the confirmed request
+        metadata = await asyncio.to_thread(probe_media, request.source_url, source_type)
+        if metadata is not None:
+            transcript_tokens = estimate_transcript_tokens(metadata.duration)
+            if request.token_budget is not None:
+                transcript_tokens = min(transcript_tokens, transcript_tokens_within_budget(request.token_budget))
+            return TranscriptProcessResponse(
+                transcript="", token_count=estimate_prompt_transcript_token_count(transcript_tokens)
+            )
+
+    transcription = await resolve_transcription(request, source_type, user)
+
+    if request.mode == "local":
+        # Free and immediate, so it needs no confirmation
+        return TranscriptProcessResponse(
+            transcript=transcription, token_count=0, summary=extractive_summary(transcription)
+        )
 
     # Calculate the total tokens
-    total_transcript_tokens = await total_prompt_transcript_token_count(transcription)
+    summarized_transcript = fit_transcript_to_budget(transcription, request.token_budget)
+    total_transcript_tokens = await total_prompt_transcript_token_count(summarized_transcript)
 
     summary = ""
+    quote_id = None
     if request.confirm_summary:
-        summary = await summarize_text(transcription)
+        summary = await summarize_text(summarized_transcript, request.use_cache)
         increment_ai_api_counter(user_id=user["id"], db_session=db)
+    else:
+        quote_id = await asyncio.to_thread(
+            quote_store.create,
+            user["id"],
+            "transcript",
+            transcript_quote_params(request),
+            {"transcript": transcription, "token_count": total_transcript_tokens},
+        )
 
     return TranscriptProcessResponse(
-        transcript=transcription, token_count=total_transcript_tokens, summary=summary
+        transcript=transcription, token_count=total_transcript_tokens, summary=summary, quote_id=quote_id
     )
+
+
+@router.post("/audio-summary/stream/", tags=["Summarize Audio from a Video"])
+async def audio_summary_stream(
+    request: TranscriptProcessRequest,
+    user: dict = Depends(get_current_user),
+):
+    """
+    Stream the summary as Server-Sent Events: a "transcript" event once the
+    media is transcribed, "delta" events carrying summary text as the model
+    produces it, and a closing "done" event with the full summary and token
+    usage. Streaming always runs the summary, so confirm_summary is ignored.
+    In "local" mode the extractive summary arrives in the "done" event alone.
+    """
+    source_type = determine_source_type(request.source_url)
+    if source_type == "unsupported":
+        raise HTTPException(status_code=400, detail="Unsupported URL type provided.")
+    validate_summary_mode(request.mode)
+
+    transcription = await resolve_transcription(request, source_type, user)
+    total_transcript_tokens = 0
+    summarized_transcript = transcription
+    if request.mode == "llm":
+        summarized_transcript = fit_transcript_to_budget(transcription, request.token_budget)
+        total_transcript_tokens = await total_prompt_transcript_token_count(summarized_transcript)
+
+    async def events():
+        yield format_sse("transcript", {"transcript": transcription, "token_count": total_transcript_tokens})
+        if request.mode == "local":
+            yield format_sse("done", {"summary": extractive_summary(transcription), "token_count": 0, "usage": None})
+            return
+        try:
+            prompt = await prepare_summary_prompt(summarized_transcript, request.use_cache)
+            result = None
+            async for event in stream_chat_completion(
+                SUMMARY_MODEL,
+                [{"role": "user", "content": prompt}],
+                SUMMARY_RESPONSE_TOKENS,
+                0,
+                use_cache=request.use_cache,
+            ):
+                if event["type"] == "delta":
+                    yield format_sse("delta", {"text": event["text"]})
+                else:
+                    result = event["result"]
+            summary = completion_text(result)
+            db = SessionLocal()  # The request's session is closed before the stream body runs
+            try:
+                increment_ai_api_counter(user_id=user["id"], db_session=db)
+            finally:
+                db.close()
+        except HTTPException as e:
+            # Headers are already sent, so report failures in-band
+            yield format_sse("error", {"detail": e.detail})
+            return
+        except Exception as e:
+            print(f"Audio summary stream failed: {e}")
+            yield format_sse("error", {"detail": f"Failed to summarize the text: {str(e)}"})
+            return
+        yield format_sse("done", {
+            "summary": summary,
+            "token_count": total_transcript_tokens,
+            "usage": result["usage"] or estimate_usage(prompt, summary, SUMMARY_MODEL),
+            "cached": result.get("cached", False),
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/llm-stats/", tags=["Summarize Audio from a Video"])
+async def llm_stats(user: dict = Depends(get_current_user)):
+    """Report LLM token usage per model and response cache hit/miss counters."""
+    return {"usage": get_usage_stats(), "cache": llm_cache.stats()}
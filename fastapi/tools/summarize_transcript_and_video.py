@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
-import openai
+from typing import Callable, Iterator, List, NamedTuple, Optional
 from dotenv import load_dotenv
 import os
 import asyncio
@@ -14,27 +14,66 @@ from sqlalchemy.orm import Session
 
 from tools.summarize_video import (
     download_and_extract_video,
-    get_frame_description,
-    extract_frames,
+    describe_media_frames,
+    estimate_frame_description_tokens,
+    frame_token_cost,
+    FRAME_DESCRIPTION_CONCURRENCY,
+    TOKENS_PER_FRAME_RESPONSE,
+    sample_timestamps,
+    validate_frame_batching,
+    sample_frames,
+    sample_guided_frames,
+)
+from tools.transcribe_media import process_media_segments, determine_source_type
+from utilities.whisper_models import DEFAULT_TRANSCRIPTION_PROFILE, TranscriptionProfile
+from utilities.frame_selection import SCENE_CHANGE_THRESHOLD, DEFAULT_MIN_FRAMES, DEFAULT_MAX_FRAMES, expected_frame_count
+from utilities.media_probe import estimate_transcript_tokens, probe_media
+from utilities.frame_sampler import SampledFrame, iter_frames_at, probe_duration, probe_frame_size
+from utilities.media_probe import MediaMetadata
+from utilities.quote_store import quote_store
+from utilities.media_fingerprint import media_identity
+from utilities.token_budget import BudgetPlan, plan_budget
+from tools.token_counter import (
+    calculate_token_count,
+    estimate_usage,
+    template_token_count,
+    truncate_to_tokens,
 )
-from tools.transcribe_media import process_media_transcription, determine_source_type
-from tools.token_counter import calculate_token_count
 from utilities.auth import get_current_user
 
 from utilities.auth import get_current_user
 from utilities.increment_ai_api_counter import increment_ai_api_counter
-from database import get_db
+from utilities.llm_client import billed_tokens, chat_completion, completion_text, stream_chat_completion
+from utilities.sse import format_sse
+from utilities.extractive_summary import extractive_summary, validate_summary_mode
+from database import SessionLocal, get_db
 
 router = APIRouter()
 load_dotenv()  # Load environment variables from .env file
 
-openai.api_key = os.getenv("OPENAI_API_KEY")  # Set your OpenAI API key
 PROCESSED_DIR = "processed"
 
 
 class SummaryRequest(BaseModel):
     source_url: str
     confirm_summary: bool = False
+    profile: TranscriptionProfile = DEFAULT_TRANSCRIPTION_PROFILE
+    frame_interval: float = 1.0  # Seconds between sampled frames
+    keyframes_only: bool = False  # Sample only I-frames, which is much faster on long videos
+    scene_change_threshold: int = SCENE_CHANGE_THRESHOLD  # 0 keeps every sampled frame
+    min_frames: int = DEFAULT_MIN_FRAMES
+    max_frames: int = DEFAULT_MAX_FRAMES
+    sampling: str = "uniform"  # "uniform" or "transcript" to pick frames from speech timing
+    frame_batch_size: int = 1  # Frames packed into one vision request, at most MAX_FRAME_BATCH_SIZE
+    batch_mode: str = "multi_image"  # "multi_image" or "mosaic"
+    save_frames: bool = False  # Include the full-resolution sampled frames in the packaged zip
+    use_cache: bool = True  # Set to False to bypass cached LLM responses
+    mode: str = "llm"  # "llm", or "local" for an extractive transcript summary made without any LLM call
+    precise_estimate: bool = False  # Transcribe and decode before quoting instead of estimating from metadata
+    quote_id: Optional[str] = None  # From a precise estimate; lets the confirmed request reuse its artifacts
+    token_budget: Optional[int] = None  # Thin frames and trim the transcript so the whole job fits this many tokens
+    target_latency_seconds: Optional[float] = None  # Cap the frames at what can be described in about this long
+    max_transcript_tokens: Optional[int] = None  # Transcript tokens passed to the summary; the rest is cut
 
 
 class SummaryResponse(BaseModel):
@@ -42,14 +81,12 @@ class SummaryResponse(BaseModel):
     estimate_token_count: int
     summary: str
     zip_file_path: str
+    quote_id: Optional[str] = None  # Pass back with confirm_summary to skip transcription and frame selection
+    plan: Optional[dict] = None  # Sampling, frame cap and transcript cut chosen for the token budget or latency target
 
 
-async def summarize_text(
-    transcript: str, aggregated_frame_descriptions: str
-) -> (str, int):
-    """
-    Summarize the provided transcript and frame descriptions using GPT-4.
-    """
+def build_summary_params(transcript: str, aggregated_frame_descriptions: str) -> dict:
+    """Chat completion parameters for the combined transcript and frame summary."""
     prompt = f"""
     Create a comprehensive summary combining the provided audio transcription and image frame descriptions:
     
@@ -65,82 +102,342 @@ async def summarize_text(
         "role": "user",
         "content": prompt,
     }
-    params = {
+    return {
         "model": "gpt-4",
         "messages": [prompt_message],
         "max_tokens": 600,
         "temperature": 0,
     }
-    result = openai.ChatCompletion.create(**params)
-    summary = result.choices[0].message.content
-    final_summary_token_estimate = calculate_token_count(prompt) + 600
-    return summary, final_summary_token_estimate
 
 
-async def process_summary(request: SummaryRequest, user: dict, db: Session) -> SummaryResponse:
+async def summarize_text(
+    transcript: str, aggregated_frame_descriptions: str, use_cache: bool = True
+) -> (str, int):
+    """
+    Summarize the provided transcript and frame descriptions using GPT-4.
+    Returns the summary and the tokens billed for it, none for a cached answer.
+    """
+    params = build_summary_params(transcript, aggregated_frame_descriptions)
+    result = await chat_completion(**params, use_cache=use_cache)
+    return completion_text(result), billed_tokens(result)
+
+
+def validate_summary_request(request: SummaryRequest) -> str:
+    """Reject malformed requests before any work is done and return the source type."""
     source_type = determine_source_type(request.source_url)
     if source_type == "unsupported":
         raise HTTPException(status_code=400, detail="Unsupported URL type provided.")
 
-    transcription, content_dir = await process_media_transcription(
-        request.source_url, source_type
+    if request.sampling not in ("uniform", "transcript"):
+        raise HTTPException(status_code=400, detail="Sampling must be 'uniform' or 'transcript'.")
+    validate_summary_mode(request.mode)
+    validate_frame_batching(request.frame_batch_size, request.batch_mode)
+    return source_type
+
+
+class PreparedSummary(NamedTuple):
+    request: SummaryRequest  # With any budget plan applied
+    plan: Optional[BudgetPlan]
+    transcription: str
+    content_dir: str
+    video_path: Optional[str]  # None for local summaries, which use no frames
+    make_samples: Optional[Callable[[], Iterator[SampledFrame]]]
+
+
+def wants_plan(request: SummaryRequest) -> bool:
+    return request.mode == "llm" and (request.token_budget is not None or request.target_latency_seconds is not None)
+
+
+def summary_prompt_tokens() -> int:
+    """Tokens of the final summary request without transcript or frame descriptions."""
+    return template_token_count(build_summary_params("", "")["messages"][0]["content"]) + 600
+
+
+def plan_summary_request(
+    request: SummaryRequest, duration: Optional[float], frame_size: Optional[tuple], transcript_tokens: int
+) -> (SummaryRequest, BudgetPlan):
+    """Tighten the request's sampling and transcript length to fit its token budget and latency target."""
+    if duration is None:
+        raise HTTPException(status_code=400, detail="Could not read the video duration to plan a budget.")
+    if request.max_transcript_tokens is not None:
+        transcript_tokens = min(transcript_tokens, request.max_transcript_tokens)
+    plan = plan_budget(
+        duration,
+        fixed_tokens=summary_prompt_tokens(),
+        frame_tokens=frame_token_cost(request.frame_batch_size, request.batch_mode, frame_size),
+        transcript_tokens=transcript_tokens,
+        token_budget=request.token_budget,
+        target_latency_seconds=request.target_latency_seconds,
+        frame_interval=request.frame_interval if request.sampling == "uniform" else None,
+        max_frames=request.max_frames,
+        frames_per_request=request.frame_batch_size,
+        concurrent_requests=FRAME_DESCRIPTION_CONCURRENCY,
+    )
+    max_transcript_tokens = request.max_transcript_tokens
+    if request.token_budget is not None:
+        # Cap the transcript at whatever the frames leave, so a longer transcript
+        # than `transcript_tokens` predicted still cannot overrun the budget
+        room = request.token_budget - plan.estimated_tokens + (
+            transcript_tokens if plan.transcript_tokens is None else plan.transcript_tokens
+        )
+        room = max(room, 0)
+        max_transcript_tokens = room if max_transcript_tokens is None else min(max_transcript_tokens, room)
+    planned = request.model_copy(update={
+        "frame_interval": plan.frame_interval or request.frame_interval,
+        "max_frames": plan.max_frames,
+        "min_frames": min(request.min_frames, plan.max_frames),
+        "max_transcript_tokens": max_transcript_tokens,
+    })
+    return planned, plan
+
+
+async def plan_from_metadata(request: SummaryRequest, source_type: str, probe: bool):
+    """Probe the source when asked to, and plan the request's budget from its metadata if it has one."""
+    metadata, planned, plan = None, request, None
+    if probe:
+        metadata = await asyncio.to_thread(probe_media, request.source_url, source_type)
+    if wants_plan(request) and metadata is not None:
+        planned, plan = plan_summary_request(
+            request, metadata.duration, metadata.frame_size, estimate_transcript_tokens(metadata.duration)
+        )
+    return metadata, planned, plan
+
+
+def summary_transcript(prepared: PreparedSummary) -> str:
+    """The transcript as the summary prompt gets it, cut to the request's token limit."""
+    if prepared.request.max_transcript_tokens is None:
+        return prepared.transcription
+    return truncate_to_tokens(prepared.transcription, prepared.request.max_transcript_tokens)
+
+
+def estimate_from_metadata(request: SummaryRequest, metadata: MediaMetadata) -> int:
+    """
+    Quote the frame descriptions and final summary from the source's duration,
+    without downloading, transcribing or decoding anything.
+    """
+    interval = request.frame_interval if request.sampling == "uniform" else None
+    frame_count = expected_frame_count(metadata.duration, interval, metadata.fps, request.max_frames)
+    frame_tokens = estimate_frame_description_tokens(
+        frame_count, request.frame_batch_size, request.batch_mode, metadata.frame_size
+    )
+    transcript_tokens = estimate_transcript_tokens(metadata.duration)
+    if request.max_transcript_tokens is not None:
+        transcript_tokens = min(transcript_tokens, request.max_transcript_tokens)
+    summary_tokens = summary_prompt_tokens() + transcript_tokens + frame_count * TOKENS_PER_FRAME_RESPONSE
+    return frame_tokens + summary_tokens
+
+
+def summary_quote_params(request: SummaryRequest) -> dict:
+    """The request fields a quote's artifacts depend on, as the user sent them."""
+    return {
+        "source_url": request.source_url,
+        "profile": request.profile,
+        "sampling": request.sampling,
+        "frame_interval": request.frame_interval,
+        "keyframes_only": request.keyframes_only,
+        "scene_change_threshold": request.scene_change_threshold,
+        "min_frames": request.min_frames,
+        "max_frames": request.max_frames,
+        "token_budget": request.token_budget,
+        "target_latency_seconds": request.target_latency_seconds,
+        "max_transcript_tokens": request.max_transcript_tokens,
+        "frame_batch_size": request.frame_batch_size,
+        "batch_mode": request.batch_mode,
+    }
+
+
+async def redeem_summary_quote(request: SummaryRequest, user: dict):
+    """The artifacts of the request's quote, or None when they cannot be reused."""
+    if not request.quote_id or not request.confirm_summary or request.mode != "llm":
+        return None
+    quote = await asyncio.to_thread(
+        quote_store.redeem, request.quote_id, user["id"], "summary", summary_quote_params(request)
+    )
+    if quote is None or not os.path.exists(quote["video_path"]) or not os.path.isdir(quote["content_dir"]):
+        return None
+    return quote
+
+
+async def prepare_summary_sources(
+    request: SummaryRequest,
+    user: dict,
+    planned: Optional[SummaryRequest] = None,
+    plan: Optional[BudgetPlan] = None,
+) -> PreparedSummary:
+    """
+    Transcribe the media and download the video for a summary request, and
+    build a factory for the frame samples it asks for. A valid quote supplies
+    all of these from its estimate. A budget plan the source's metadata could
+    not provide is made here from the transcript and the video header.
+    `request` is the request as sent, and `planned` the same request with a
+    plan from metadata already applied.
+    """
+    source_type = validate_summary_request(request)
+    quote = await redeem_summary_quote(request, user)
+    if quote is not None:
+        video_path = quote["video_path"]
+        planned = request.model_copy(update={"max_transcript_tokens": quote["max_transcript_tokens"]})
+        plan = BudgetPlan(**quote["plan"]) if quote["plan"] else None
+        make_samples = lambda: iter_frames_at(video_path, quote["frame_timestamps"])
+        return PreparedSummary(planned, plan, quote["transcription"], quote["content_dir"], video_path, make_samples)
+
+    transcription, segments, content_dir = await process_media_segments(
+        request.source_url, source_type, request.profile
     )
     print(transcription)
-    video_path = await download_and_extract_video(request.source_url, PROCESSED_DIR)
-    frames_dir = Path(video_path).parent / "extracted_frames"
-    if not frames_dir.exists():
-        frames_dir.mkdir(parents=True, exist_ok=True)
 
     transcription_file_path = Path(content_dir) / "transcription.txt"
     with open(transcription_file_path, "w", encoding="utf-8") as f:
         f.write(transcription)
 
-    frames = extract_frames(video_path, str(frames_dir))
+    if request.mode == "local":
+        return PreparedSummary(request, None, transcription, content_dir, None, None)
+    video_path = await download_and_extract_video(request.source_url, PROCESSED_DIR)
+
+    planned = planned or request
+    if wants_plan(request) and plan is None:
+        duration, frame_size = await asyncio.to_thread(
+            lambda: (probe_duration(video_path), probe_frame_size(video_path))
+        )
+        planned, plan = plan_summary_request(request, duration, frame_size, calculate_token_count(transcription))
+
+    if planned.sampling == "transcript":
+        sampler = sample_guided_frames
+        sampling_args = (segments, planned.scene_change_threshold, planned.max_frames)
+    else:
+        sampler = sample_frames
+        sampling_args = (
+            planned.frame_interval,
+            planned.keyframes_only,
+            planned.scene_change_threshold,
+            planned.min_frames,
+            planned.max_frames,
+        )
+    make_samples = lambda: sampler(video_path, *sampling_args)
+    return PreparedSummary(planned, plan, transcription, content_dir, video_path, make_samples)
+
+
+async def describe_request_frames(request: SummaryRequest, video_path: str, make_samples) -> list:
+    """
+    Describe the sampled frames, saving them next to the video when requested.
+    Descriptions made for the same or near-duplicate media with the same frame
+    settings are reused.
+    """
+    frames_dir = None
+    if request.save_frames:
+        frames_dir = Path(video_path).parent / "extracted_frames"
+        frames_dir.mkdir(parents=True, exist_ok=True)
+    media_key = await asyncio.to_thread(media_identity, request.source_url, video_path)
+    frame_params = summary_quote_params(request)
+    del frame_params["source_url"], frame_params["max_transcript_tokens"]
+    return await describe_media_frames(
+        media_key,
+        frame_params,
+        make_samples,
+        request.frame_batch_size,
+        request.batch_mode,
+        request.use_cache,
+        str(frames_dir) if frames_dir else None,
+    )
+
+
+def package_summary(content_dir: str, summary: str) -> str:
+    """Save the summary into the content directory and zip the directory."""
+    summary_file_path = Path(content_dir) / "final_summary.txt"
+    with open(summary_file_path, "w", encoding="utf-8") as f:
+        f.write(summary)
+
+    # Zip the content directory
+    zip_filename = f"{Path(content_dir).name}.zip"
+    zip_file_path = Path(PROCESSED_DIR) / zip_filename
+    with zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for root, _, files in os.walk(content_dir):
+            for file in files:
+                file_path = os.path.join(root, file)
+                zipf.write(
+                    file_path, arcname=os.path.relpath(file_path, start=content_dir)
+                )
+    return str(zip_file_path)  # Convert Path object to string for JSON serialization
+
+
+async def process_summary(request: SummaryRequest, user: dict, db: Session) -> SummaryResponse:
+    source_type = validate_summary_request(request)
+    from_metadata = request.mode == "llm" and not request.confirm_summary and not request.precise_estimate
+    reuses_quote = request.confirm_summary and request.quote_id
+    metadata, planned, plan = await plan_from_metadata(
+        request, source_type, from_metadata or (wants_plan(request) and not reuses_quote)
+    )
+    if from_metadata and metadata is not None:
+        return SummaryResponse(
+            token_count=0,
+            estimate_token_count=estimate_from_metadata(planned, metadata),
+            summary="",
+            zip_file_path="",
+            plan=plan._asdict() if plan else None,
+        )
+
+    prepared = await prepare_summary_sources(request, user, planned, plan)
+    transcription, content_dir = prepared.transcription, prepared.content_dir
+    video_path, make_samples = prepared.video_path, prepared.make_samples
+
+    if request.mode == "local":
+        # Free and immediate, so it needs no confirmation
+        summary = extractive_summary(transcription)
+        return SummaryResponse(
+            token_count=0,
+            estimate_token_count=0,
+            summary=summary,
+            zip_file_path=await asyncio.to_thread(package_summary, content_dir, summary),
+        )
+
     frame_descriptions = []
     token_counter = 0
     summary = ""
     zip_file_path = ""
+    quote_id = None
 
-    for frame in frames:
-        frame_total_tokens = 280  # Assume a base token count per frame for estimation
-        if request.confirm_summary:
-            description, tokens_from_description = await asyncio.to_thread(
-                get_frame_description, frame
-            )
-            frame_descriptions.append(description)
-            token_counter += (
-                tokens_from_description  # Add the actual tokens from description
-            )
-        else:
-            token_counter += (
-                frame_total_tokens  # Add the estimated tokens if not confirming summary
-            )
+    if request.confirm_summary:
+        results = await describe_request_frames(request, video_path, make_samples)
+        frame_descriptions = [description for description, _ in results]
+        token_counter += sum(
+            tokens for _, tokens in results  # Add the actual tokens from description
+        )
+    else:
+        frame_timestamps = await asyncio.to_thread(sample_timestamps, make_samples)
+        frame_count = len(frame_timestamps)
+        frame_size = await asyncio.to_thread(probe_frame_size, video_path)
+        token_counter += estimate_frame_description_tokens(
+            frame_count, request.frame_batch_size, request.batch_mode, frame_size
+        )
+        # The final summary, as the confirmed path counts it
+        token_counter += (
+            summary_prompt_tokens()
+            + calculate_token_count(summary_transcript(prepared))
+            + frame_count * TOKENS_PER_FRAME_RESPONSE
+        )
+        quote_id = await asyncio.to_thread(
+            quote_store.create,
+            user["id"],
+            "summary",
+            summary_quote_params(request),
+            {
+                "transcription": transcription,
+                "content_dir": content_dir,
+                "video_path": video_path,
+                "frame_timestamps": frame_timestamps,
+                "max_transcript_tokens": prepared.request.max_transcript_tokens,
+                "plan": prepared.plan._asdict() if prepared.plan else None,
+                "estimate_token_count": token_counter,
+            },
+        )
 
     if request.confirm_summary:
         aggregated_frame_descriptions = " ".join(frame_descriptions)
-        summary, final_summary_token_estimate = await summarize_text(
-            transcription, aggregated_frame_descriptions
+        summary, final_summary_tokens = await summarize_text(
+            summary_transcript(prepared), aggregated_frame_descriptions, request.use_cache
         )
-        token_counter += final_summary_token_estimate
-
-        # Save the summary to a text file
-        summary_file_path = Path(content_dir) / "final_summary.txt"
-        with open(summary_file_path, "w", encoding="utf-8") as f:
-            f.write(summary)
-
-        # Zip the content directory
-        zip_filename = f"{Path(content_dir).name}.zip"
-        zip_file_path = Path(PROCESSED_DIR) / zip_filename
-        with zipfile.ZipFile(zip_file_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(content_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    zipf.write(
-                        file_path, arcname=os.path.relpath(file_path, start=content_dir)
-                    )
-        zip_file_path = str(
-            zip_file_path
-        )  # Convert Path object to string for JSON serialization
+        token_counter += final_summary_tokens
+        zip_file_path = package_summary(content_dir, summary)
         increment_ai_api_counter(user_id=user["id"], db_session=db)
 
     # Calculate the estimated token count based on frames and other elements
@@ -151,6 +448,8 @@ async def process_summary(request: SummaryRequest, user: dict, db: Session) -> S
         estimate_token_count=estimate_token_count,
         summary=summary,
         zip_file_path=zip_file_path,
+        quote_id=quote_id,
+        plan=prepared.plan._asdict() if prepared.plan else None,
     )
 
 
@@ -165,3 +464,76 @@ async def summarize_transcript_and_video(
     db: Session = Depends(get_db),
 ) -> SummaryResponse:
     return await process_summary(request, user, db)
+
+
+@router.post("/summarize_transcript_and_video/stream/", tags=["Summarize Audio & Video"])
+async def summarize_transcript_and_video_stream(
+    request: SummaryRequest,
+    user: dict = Depends(get_current_user),
+):
+    """
+    Stream the summary as Server-Sent Events: a "frames" event once the frames
+    are described, "delta" events carrying summary text as the model produces
+    it, and a closing "done" event with the summary, zip path and token usage.
+    Streaming always runs the summary, so confirm_summary is ignored. In
+    "local" mode the extractive summary arrives in the "done" event alone.
+    """
+    source_type = validate_summary_request(request)
+    request = request.model_copy(update={"confirm_summary": True})
+    _, planned, plan = await plan_from_metadata(request, source_type, wants_plan(request) and not request.quote_id)
+    prepared = await prepare_summary_sources(request, user, planned, plan)
+    transcription, content_dir = prepared.transcription, prepared.content_dir
+    video_path, make_samples = prepared.video_path, prepared.make_samples
+
+    async def events():
+        try:
+            if request.mode == "local":
+                summary = extractive_summary(transcription)
+                zip_file_path = await asyncio.to_thread(package_summary, content_dir, summary)
+                yield format_sse("done", {
+                    "summary": summary,
+                    "zip_file_path": zip_file_path,
+                    "usage": None,
+                    "token_count": 0,
+                    "estimate_token_count": 0,
+                })
+                return
+            results = await describe_request_frames(request, video_path, make_samples)
+            frame_descriptions = [description for description, _ in results]
+            frame_tokens = sum(tokens for _, tokens in results)
+            yield format_sse("frames", {"frame_count": len(frame_descriptions), "token_count": frame_tokens})
+
+            params = build_summary_params(summary_transcript(prepared), " ".join(frame_descriptions))
+            result = None
+            async for event in stream_chat_completion(**params, use_cache=request.use_cache):
+                if event["type"] == "delta":
+                    yield format_sse("delta", {"text": event["text"]})
+                else:
+                    result = event["result"]
+
+            summary = completion_text(result)
+            usage = result["usage"] or estimate_usage(params["messages"][0]["content"], summary, params["model"])
+            zip_file_path = await asyncio.to_thread(package_summary, content_dir, summary)
+            db = SessionLocal()  # The request's session is closed before the stream body runs
+            try:
+                increment_ai_api_counter(user_id=user["id"], db_session=db)
+            finally:
+                db.close()
+        except HTTPException as e:
+            # Headers are already sent, so report failures in-band
+            yield format_sse("error", {"detail": e.detail})
+            return
+        except Exception as e:
+            print(f"Summary stream failed: {e}")
+            yield format_sse("error", {"detail": f"Failed to summarize the transcript and video: {str(e)}"})
+            return
+        yield format_sse("done", {
+            "summary": summary,
+            "zip_file_path": zip_file_path,
+            "usage": usage,
+            "token_count": usage["completion_tokens"],
+            "estimate_token_count": frame_tokens + (0 if result.get("cached") else usage["total_tokens"]),
+            "plan": prepared.plan._asdict() if prepared.plan else None,
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream")
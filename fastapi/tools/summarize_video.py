@@ -1,101 +1,169 @@
 import os
 import cv2
-import shutil
-import openai
-import base64
 import datetime
 import asyncio
+import math
+import re
+import numpy as np
 
 from fastapi import APIRouter, HTTPException, Form, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, Callable, Iterator, List, Optional
 from sqlalchemy.orm import Session
 
-from tools.audio_video_separator import determine_source_type
-from tools.youtube_downloader import download_youtube_video_util
-from tools.instagram_downloader import download_instagram_content_for_processing
+from tools.audio_video_separator import determine_source_type, download_media
 
 from utilities.auth import get_current_user
 from utilities.increment_ai_api_counter import increment_ai_api_counter
-from database import get_db 
+from utilities.frame_sampler import SampledFrame, iter_frames, iter_frames_at, probe_duration, probe_frame_size
+from utilities.frame_preprocessing import VISION_DETAIL, PreparedFrame, encode_jpeg_base64, prepare_frame
+from utilities.token_budget import ASSUMED_FRAME_SIZE, BudgetPlan, image_tokens, plan_budget
+from utilities.concurrency import iterate_in_thread
+from utilities.rate_limiter import vision_rate_limiter
+from utilities.llm_client import billed_tokens, chat_completion, completion_text, discard_completion, stream_chat_completion
+from utilities.sse import format_sse
+from tools.token_counter import estimate_usage
+from utilities.media_probe import probe_media
+from utilities.quote_store import quote_store
+from utilities.media_fingerprint import media_identity, media_index
+from utilities.frame_selection import (
+    FrameSelector,
+    SCENE_CHANGE_THRESHOLD,
+    DEFAULT_MIN_FRAMES,
+    DEFAULT_MAX_FRAMES,
+    expected_frame_count,
+    select_guided_frames,
+    thin_evenly,
+    transcript_guided_timestamps,
+)
+from database import SessionLocal, get_db 
 
 
 router = APIRouter()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 processed_dir= "processed"
 
-# Constants for token estimation
-TOKENS_PER_IMAGE = 280
+# Resolution of the sampling pass that transcript-guided frames are picked from
+GUIDED_SAMPLE_RESOLUTION = 0.5
+# Frames decoded ahead of the vision calls consuming them
+FRAME_QUEUE_SIZE = 8
+# Vision requests in flight at once
+FRAME_DESCRIPTION_CONCURRENCY = int(os.getenv("FRAME_DESCRIPTION_CONCURRENCY", "8"))
+
+# Constants for token estimation; image input is priced from the frame size and VISION_DETAIL
+TOKENS_PER_VISION_PROMPT = 125
+TOKENS_PER_FRAME_RESPONSE = 70
 TOKENS_PER_SUMMARY_PROMPT = 250
 TOKENS_PER_SUMMARY_RESPONSE = 750
 
+BATCH_MODES = ("multi_image", "mosaic")
+# Most frames per vision request; keeps the reply (TOKENS_PER_FRAME_RESPONSE a frame) well within the output limit
+MAX_FRAME_BATCH_SIZE = int(os.getenv("MAX_FRAME_BATCH_SIZE", "10"))
+# Edge length of the mosaic sent for "mosaic" batches; matches the low-detail tile
+MOSAIC_SIZE = 512
+
 class VideoAnalysisRequest(BaseModel):
     url: str
     confirm_analysis: bool = False
+    frame_interval: float = 1.0  # Seconds between sampled frames
+    keyframes_only: bool = False  # Sample only I-frames, which is much faster on long videos
+    scene_change_threshold: int = SCENE_CHANGE_THRESHOLD  # 0 keeps every sampled frame
+    min_frames: int = DEFAULT_MIN_FRAMES
+    max_frames: int = DEFAULT_MAX_FRAMES
+    frame_batch_size: int = 1  # Frames packed into one vision request, at most MAX_FRAME_BATCH_SIZE
+    batch_mode: str = "multi_image"  # "multi_image" or "mosaic"
+    use_cache: bool = True  # Set to False to bypass cached LLM responses
+    precise_estimate: bool = False  # Decode the video before quoting instead of estimating from metadata
+    quote_id: Optional[str] = None  # From a precise estimate; lets the confirmed request reuse its frames
+    token_budget: Optional[int] = None  # Thin the frames so the whole job fits this many tokens
+    target_latency_seconds: Optional[float] = None  # Cap the frames at what can be described in about this long
 
 class VideoAnalysisResponse(BaseModel):
     estimated_total_token_usage: int
     frame_descriptions: list = None
     video_summary: str = None
     open_ai_token_counter: int
-
-def get_safe_title(title: str) -> str:
-    """Generate a filesystem-safe title."""
-    return "".join([c if c.isalnum() or c in " _-." else "_" for c in title])
+    quote_id: Optional[str] = None  # Pass back with confirm_analysis to skip the download and frame selection
+    plan: Optional[dict] = None  # Frame interval and cap chosen for the token budget or latency target
 
 async def download_and_extract_video(url: str, processed_dir: str) -> str:
-    """Download and extract video from Instagram or YouTube."""
+    """Fetch the video of an Instagram or YouTube URL through the shared media cache."""
     source_type = determine_source_type(url)
-    if source_type == "youtube":
-        download_info = download_youtube_video_util(url, processed_dir)
-        title = get_safe_title(download_info["title"])
-        video_dir = Path(processed_dir) / title
-        video_path = video_dir / (title + ".mp4")
-        if not video_dir.exists():
-            video_dir.mkdir(parents=True, exist_ok=True)
-            shutil.move(download_info["video_path"], video_path)
-    elif source_type == "instagram":
-        content_dir, shortcode = download_instagram_content_for_processing(url, processed_dir)
-        title = get_safe_title(shortcode)
-        new_content_dir = Path(processed_dir) / title
-        if not new_content_dir.exists():
-            new_content_dir.mkdir(parents=True, exist_ok=True)
-            for item in Path(content_dir).iterdir():
-                shutil.move(str(item), str(new_content_dir / item.name))
-        video_files = list(new_content_dir.glob("*.mp4"))
-        if video_files:
-            video_path = str(video_files[0])
-        else:
-            raise HTTPException(status_code=400, detail="No video file found in downloaded content.")
-    else:
+    if source_type == "unsupported":
         raise HTTPException(status_code=400, detail="Unsupported URL type.")
-    return str(video_path)
-
-def extract_frames(video_path: str, output_folder: str) -> list:
-    """Extract frames from a video file."""
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frames = []
-    success, frame_count = True, 0
-    while success:
-        success, frame = cap.read()
-        if success and frame_count % round(fps) == 0:
-            frame_path = Path(output_folder) / f"frame_{frame_count // round(fps)}.jpg"
-            cv2.imwrite(str(frame_path), frame)
-            frames.append(str(frame_path))
-        frame_count += 1
-    cap.release()
-    return frames
-
-def image_to_base64(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-    
-def get_frame_description(frame_path: str) -> str:
+    video_path, _ = await asyncio.to_thread(download_media, url, source_type, processed_dir)
+    return video_path
+
+def sample_frames(
+    video_path: str,
+    interval_seconds: float = 1.0,
+    keyframes_only: bool = False,
+    scene_change_threshold: int = 0,
+    min_frames: int = DEFAULT_MIN_FRAMES,
+    max_frames: int = 0,
+) -> Iterator[SampledFrame]:
+    """
+    Sample one frame every `interval_seconds` from a video file. With a
+    scene-change threshold or frame cap, near-duplicate frames are dropped so
+    only visually distinct ones come through. When the video has no duration
+    in its header, capped frames are picked once the whole video is read and
+    then decoded again by seeking to them.
+    """
+    if interval_seconds <= 0:
+        raise HTTPException(status_code=400, detail="Frame interval must be greater than zero.")
+    selector, duration = None, None
+    if scene_change_threshold > 0 or max_frames > 0:
+        duration = probe_duration(video_path)
+        selector = FrameSelector(scene_change_threshold, min_frames, max_frames, duration)
+    samples = (
+        sampled
+        for sampled in iter_frames(video_path, interval_seconds, keyframes_only)
+        if selector is None or selector.accept(sampled.image, sampled.timestamp)
+    )
+    if max_frames > 0 and not duration:
+        # Spacing for the cap is unknown up front, so thin once every frame is seen,
+        # holding only timestamps, and seek back to the frames that were kept
+        timestamps = thin_evenly((sampled.timestamp for sampled in samples), max_frames)
+        yield from iter_frames_at(video_path, timestamps)
+        return
+    yield from samples
+
+def sample_guided_frames(
+    video_path: str,
+    segments: List[dict],
+    scene_change_threshold: int = SCENE_CHANGE_THRESHOLD,
+    max_frames: int = DEFAULT_MAX_FRAMES,
+) -> Iterator[SampledFrame]:
+    """
+    Sample frames aligned to the transcript: at segment boundaries, through
+    long stretches without speech, and at visual scene changes.
+    """
+    targets = transcript_guided_timestamps(segments, probe_duration(video_path), max_frames)
+    samples = iter_frames(video_path, GUIDED_SAMPLE_RESOLUTION)
+    yield from select_guided_frames(samples, targets, scene_change_threshold, max_frames)
+
+def sample_timestamps(make_samples: Callable[[], Iterator[SampledFrame]]) -> List[float]:
+    """Run a sampler to the end, keeping only the timestamps of the frames it selects."""
+    return [sampled.timestamp for sampled in make_samples()]
+
+def stream_frames(
+    make_samples: Callable[[], Iterator[SampledFrame]], output_folder: Optional[str] = None
+) -> AsyncIterator[PreparedFrame]:
+    """
+    Decode and prepare frames in a worker thread while the caller consumes them.
+    At most FRAME_QUEUE_SIZE frames are ever waiting, so memory stays flat no
+    matter how long the video is. Frames are only written to disk when an
+    `output_folder` is given.
+    """
+    return iterate_in_thread(
+        lambda: (prepare_frame(sampled, output_folder) for sampled in make_samples()), FRAME_QUEUE_SIZE
+    )
+
+async def get_frame_description(frame: PreparedFrame, use_cache: bool = True) -> str:
     """Generate a description of an image frame using OpenAI's GPT model."""
-    base64_image = image_to_base64(frame_path)
+    base64_image = frame.base64_jpeg
     image_prompt = """
     Describe the scene captured in this frame, focusing on key elements such as actions, objects, settings, and any text. Mention the main activity, characters, and mood, if discernible. Include text details: 'Visible Text: [text]'. Note any significant symbols or signs.
     Guidelines: **250 character Max Response Length**, concise language, prioritize visual elements and text, if any.
@@ -109,8 +177,7 @@ def get_frame_description(frame_path: str) -> str:
                 "type": "image_url",
                 "image_url": {
                     "url": f"data:image/jpeg;base64,{base64_image}",
-                    "detail": "low",
-                    "resize": 768
+                    "detail": VISION_DETAIL,
                 }
             }
         ]
@@ -122,16 +189,204 @@ def get_frame_description(frame_path: str) -> str:
         "max_tokens": 70,
         "temperature": 0.5,
     }
-    result = openai.ChatCompletion.create(**params)
-    description = result.choices[0].message.content
-    frame_total_tokens = result.usage['total_tokens']  
+    height, width = frame.image.shape[:2]
+    estimate = estimate_frame_description_tokens(1, 1, "multi_image", (width, height))
+    result = await chat_completion(
+        **params, use_cache=use_cache, rate_limiter=vision_rate_limiter, estimated_tokens=estimate
+    )
+    description = completion_text(result)
+    frame_total_tokens = billed_tokens(result)
     current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{current_time}] Description obtained: {description}, frame_total_tokens: {frame_total_tokens}")
     return description, frame_total_tokens
 
 
-async def generate_final_summary(descriptions: List[str], transcription: str, vid_dir: str, url: str) -> (str, str):
-    """Generate a final summary based on frame descriptions"""
+def build_mosaic(frames: List[PreparedFrame]) -> str:
+    """Tile frames into one labelled MOSAIC_SIZE square JPEG and return it base64-encoded."""
+    columns = math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / columns)
+    tile = MOSAIC_SIZE // columns
+    mosaic = np.zeros((rows * tile, columns * tile, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        image = cv2.resize(frame.image, (tile, tile), interpolation=cv2.INTER_AREA)
+        cv2.putText(image, str(i + 1), (6, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 5, cv2.LINE_AA)
+        cv2.putText(image, str(i + 1), (6, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
+        row, column = divmod(i, columns)
+        mosaic[row * tile:(row + 1) * tile, column * tile:(column + 1) * tile] = image
+    return encode_jpeg_base64(mosaic)
+
+def parse_frame_descriptions(content: str, frame_count: int) -> List[str]:
+    """Split a "Frame N: ..." answer back into one description per frame."""
+    descriptions = [""] * frame_count
+    for match in re.finditer(r"^\W*Frame\s+(\d+)\W*[:\-]\s*(.+)$", content, re.MULTILINE | re.IGNORECASE):
+        number = int(match.group(1))
+        if 1 <= number <= frame_count and not descriptions[number - 1]:
+            descriptions[number - 1] = match.group(2).strip()
+    return descriptions
+
+async def get_frames_description(
+    frames: List[PreparedFrame], batch_mode: str = "multi_image", use_cache: bool = True
+) -> (List[str], List[int]):
+    """
+    Describe several frames with one vision request, either as separate images
+    or as a single labelled mosaic. Returns one description per frame and the
+    request's token usage spread over the frames. Frames the reply leaves out
+    are described one by one, and the incomplete reply is dropped from the cache.
+    """
+    if len(frames) == 1:
+        description, tokens = await get_frame_description(frames[0], use_cache)
+        return [description], [tokens]
+
+    count = len(frames)
+    image_prompt = f"""
+    You are given {count} frames from one video, labelled Frame 1 to Frame {count} in order{" as numbered tiles of one image" if batch_mode == "mosaic" else ""}. Describe each frame, focusing on key elements such as actions, objects, settings, and any text. Mention the main activity, characters, and mood, if discernible. Include text details: 'Visible Text: [text]'. Note any significant symbols or signs.
+    Guidelines: answer with exactly one line per frame in the form 'Frame N: description', **250 character Max Response Length** per frame, concise language, prioritize visual elements and text, if any.
+    """
+    if batch_mode == "mosaic":
+        images = [build_mosaic(frames)]
+    else:
+        images = [frame.base64_jpeg for frame in frames]
+    content = [{"type": "text", "text": image_prompt}]
+    for base64_image in images:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/jpeg;base64,{base64_image}",
+                "detail": VISION_DETAIL,
+            }
+        })
+
+    params = {
+        "model": "gpt-4-vision-preview",
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": TOKENS_PER_FRAME_RESPONSE * count,
+        "temperature": 0.5,
+    }
+    height, width = frames[0].image.shape[:2]
+    estimate = estimate_frame_description_tokens(count, count, batch_mode, (width, height))
+    result = await chat_completion(
+        **params, use_cache=use_cache, rate_limiter=vision_rate_limiter, estimated_tokens=estimate
+    )
+    descriptions = parse_frame_descriptions(completion_text(result), count)
+    batch_total_tokens = billed_tokens(result)
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{current_time}] Descriptions obtained for {count} frames, batch_total_tokens: {batch_total_tokens}")
+    share, remainder = divmod(batch_total_tokens, count)
+    tokens = [share + remainder] + [share] * (count - 1)
+
+    missing = [i for i, description in enumerate(descriptions) if not description]
+    if missing:
+        print(f"[{current_time}] {len(missing)} of {count} frames missing from the reply; describing them one by one")
+        await discard_completion(**params)
+        retried = await asyncio.gather(*(get_frame_description(frames[i], use_cache) for i in missing))
+        for i, (description, retry_tokens) in zip(missing, retried):
+            descriptions[i] = description
+            tokens[i] += retry_tokens
+    return descriptions, tokens
+
+def estimate_frame_description_tokens(
+    frame_count: int, batch_size: int = 1, batch_mode: str = "multi_image", frame_size: Optional[tuple] = None
+) -> int:
+    """
+    Estimate the vision tokens needed to describe `frame_count` frames of
+    `frame_size` (width, height) in batches, at the VISION_DETAIL level.
+    """
+    requests = math.ceil(frame_count / max(batch_size, 1))
+    if batch_size > 1 and batch_mode == "mosaic":
+        images, image_cost = requests, image_tokens(MOSAIC_SIZE, MOSAIC_SIZE, VISION_DETAIL)
+    else:
+        images, image_cost = frame_count, image_tokens(*(frame_size or ASSUMED_FRAME_SIZE), VISION_DETAIL)
+    return (
+        requests * TOKENS_PER_VISION_PROMPT
+        + images * image_cost
+        + frame_count * TOKENS_PER_FRAME_RESPONSE
+    )
+
+def frame_token_cost(batch_size: int, batch_mode: str, frame_size: Optional[tuple] = None) -> float:
+    """Tokens one more frame costs: its share of a vision request plus its description in the summary prompt."""
+    batch_size = max(batch_size, 1)
+    return estimate_frame_description_tokens(batch_size, batch_size, batch_mode, frame_size) / batch_size + TOKENS_PER_FRAME_RESPONSE
+
+def validate_frame_batching(batch_size: int, batch_mode: str):
+    if not 1 <= batch_size <= MAX_FRAME_BATCH_SIZE or batch_mode not in BATCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size must be between 1 and {MAX_FRAME_BATCH_SIZE} and batch mode one of: {', '.join(BATCH_MODES)}.",
+        )
+
+async def describe_frames(
+    frames: AsyncIterator[PreparedFrame], batch_size: int = 1, batch_mode: str = "multi_image", use_cache: bool = True
+) -> List[tuple]:
+    """
+    Describe frames concurrently, `batch_size` frames per vision request, at
+    most FRAME_DESCRIPTION_CONCURRENCY requests at a time and within the vision
+    rate limits. Retries with backoff on 429s happen in the LLM client.
+    Returns (description, tokens) pairs in frame order.
+    """
+    validate_frame_batching(batch_size, batch_mode)
+    slots = asyncio.Semaphore(FRAME_DESCRIPTION_CONCURRENCY)
+
+    async def describe(batch: List[PreparedFrame]):
+        try:
+            descriptions, tokens = await get_frames_description(batch, batch_mode, use_cache)
+            return list(zip(descriptions, tokens))
+        finally:
+            slots.release()
+
+    tasks = []
+    try:
+        batch = []
+        async for frame in frames:
+            batch.append(frame)
+            if len(batch) < batch_size:
+                continue
+            # Waiting here also stops pulling frames from the decoder while all slots are busy
+            await slots.acquire()
+            tasks.append(asyncio.create_task(describe(batch)))
+            batch = []
+        if batch:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(describe(batch)))
+        results = await asyncio.gather(*tasks)
+        return [pair for batch_results in results for pair in batch_results]
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def describe_media_frames(
+    media_key: str,
+    params: dict,
+    make_samples: Callable[[], Iterator[SampledFrame]],
+    batch_size: int = 1,
+    batch_mode: str = "multi_image",
+    use_cache: bool = True,
+    frames_dir: Optional[str] = None,
+) -> List[tuple]:
+    """
+    Describe a video's frames with describe_frames, or reuse the descriptions
+    made for the same media, or a near-duplicate of it, with the same frame
+    settings `params`. Reused descriptions cost no tokens. With use_cache off,
+    or when the frames are to be saved to `frames_dir`, they are always redone.
+    Descriptions are only stored once every frame has one.
+    """
+    params = {**params, "detail": VISION_DETAIL}
+    if use_cache and frames_dir is None:
+        stored = await asyncio.to_thread(media_index.get_result, media_key, "frame_descriptions", params)
+        if stored is not None:
+            print(f"Reusing {len(stored)} frame descriptions of media {media_key}")
+            return [(description, 0) for description in stored]
+    # Describe frames while later ones are still being decoded
+    results = await describe_frames(stream_frames(make_samples, frames_dir), batch_size, batch_mode, use_cache)
+    descriptions = [description for description, _ in results]
+    if all(descriptions):
+        await asyncio.to_thread(media_index.put_result, media_key, "frame_descriptions", params, descriptions)
+    return results
+
+
+def build_final_summary_params(descriptions: List[str]) -> dict:
+    """Chat completion parameters for the final summary of the frame descriptions."""
     aggregated_descriptions = " ".join(descriptions)
     prompt = f"""
     "Create a comprehensive summary of the video combining the provided image descriptions. Focus on the overarching story, key events, and important details:
@@ -153,16 +408,15 @@ async def generate_final_summary(descriptions: List[str], transcription: str, vi
         "role": "user",
         "content": prompt,
     }
-    params = {
+    return {
         "model": "gpt-4",
         "messages": [prompt_message],
         "max_tokens": 600,
         "temperature": 0,
     }
-    result = openai.ChatCompletion.create(**params)
-    summary = result.choices[0].message.content
-    final_summary_total_tokens = result.usage['total_tokens']  
-    print("final_summary_total_tokens: ", final_summary_total_tokens)
+
+
+def write_final_summary(summary: str, vid_dir: str, url: str) -> str:
     # Define the summary file path within the reel_specific_dir
     summary_file_path = os.path.join(vid_dir, "final_summary.txt")
     
@@ -170,41 +424,175 @@ async def generate_final_summary(descriptions: List[str], transcription: str, vi
     with open(summary_file_path, "w", encoding="utf-8") as file:
         file.write(f"URL: {url}\n\n")
         file.write(summary)
+    return summary_file_path
+
+
+async def generate_final_summary(
+    descriptions: List[str], transcription: str, vid_dir: str, url: str, use_cache: bool = True
+) -> (str, str):
+    """Generate a final summary based on frame descriptions"""
+    params = build_final_summary_params(descriptions)
+    result = await chat_completion(**params, use_cache=use_cache)
+    summary = completion_text(result)
+    final_summary_total_tokens = billed_tokens(result)
+    print("final_summary_total_tokens: ", final_summary_total_tokens)
+    summary_file_path = write_final_summary(summary, vid_dir, url)
 
     return summary, summary_file_path, final_summary_total_tokens
 
 
 
+def video_quote_params(request: VideoAnalysisRequest) -> dict:
+    """The request fields a quote's frames depend on, as the user sent them."""
+    return {"url": request.url, **video_frame_params(request)}
+
+
+def video_frame_params(request: VideoAnalysisRequest) -> dict:
+    """The request fields the sampled frames and their descriptions depend on."""
+    return {
+        "frame_interval": request.frame_interval,
+        "keyframes_only": request.keyframes_only,
+        "scene_change_threshold": request.scene_change_threshold,
+        "min_frames": request.min_frames,
+        "max_frames": request.max_frames,
+        "token_budget": request.token_budget,
+        "target_latency_seconds": request.target_latency_seconds,
+        "frame_batch_size": request.frame_batch_size,
+        "batch_mode": request.batch_mode,
+    }
+
+
+def wants_plan(request: VideoAnalysisRequest) -> bool:
+    return request.token_budget is not None or request.target_latency_seconds is not None
+
+
+def plan_video_request(
+    request: VideoAnalysisRequest, duration: Optional[float], frame_size: Optional[tuple]
+) -> (VideoAnalysisRequest, BudgetPlan):
+    """Tighten the request's frame interval and cap to fit its token budget and latency target."""
+    if duration is None:
+        raise HTTPException(status_code=400, detail="Could not read the video duration to plan a budget.")
+    plan = plan_budget(
+        duration,
+        fixed_tokens=TOKENS_PER_SUMMARY_PROMPT + TOKENS_PER_SUMMARY_RESPONSE,
+        frame_tokens=frame_token_cost(request.frame_batch_size, request.batch_mode, frame_size),
+        token_budget=request.token_budget,
+        target_latency_seconds=request.target_latency_seconds,
+        frame_interval=request.frame_interval,
+        max_frames=request.max_frames,
+        frames_per_request=request.frame_batch_size,
+        concurrent_requests=FRAME_DESCRIPTION_CONCURRENCY,
+        transcribes=False,
+    )
+    planned = request.model_copy(update={
+        "frame_interval": plan.frame_interval or request.frame_interval,
+        "max_frames": plan.max_frames,
+        "min_frames": min(request.min_frames, plan.max_frames),
+    })
+    return planned, plan
+
+
+async def resolve_video_frames(
+    request: VideoAnalysisRequest,
+    user: dict,
+    planned: Optional[VideoAnalysisRequest] = None,
+    plan: Optional[BudgetPlan] = None,
+):
+    """
+    Return the budget-planned request, its plan, the video path and a sampler
+    factory. With a valid quote the frames picked during the estimate are
+    seeked to directly; otherwise the video is downloaded and sampled from
+    scratch, planning from its header when no plan could be made from the
+    source's metadata. `request` is the request as sent, and `planned` the
+    same request with a plan from metadata already applied.
+    """
+    if request.quote_id and request.confirm_analysis:
+        quote = await asyncio.to_thread(
+            quote_store.redeem, request.quote_id, user["id"], "video", video_quote_params(request)
+        )
+        if quote is not None and os.path.exists(quote["video_path"]):
+            video_path = quote["video_path"]
+            return request, plan, video_path, lambda: iter_frames_at(video_path, quote["frame_timestamps"])
+
+    video_path = await download_and_extract_video(request.url, processed_dir)
+    planned = planned or request
+    if wants_plan(request) and plan is None:
+        planned, plan = await asyncio.to_thread(
+            lambda: plan_video_request(request, probe_duration(video_path), probe_frame_size(video_path))
+        )
+    sampling_args = (
+        planned.frame_interval,
+        planned.keyframes_only,
+        planned.scene_change_threshold,
+        planned.min_frames,
+        planned.max_frames,
+    )
+    return planned, plan, video_path, lambda: sample_frames(video_path, *sampling_args)
+
+
 @router.post("/video-summary/", tags=['Summarize Video'], response_model=VideoAnalysisResponse)
 async def video_summary(
     request: VideoAnalysisRequest,
     user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
     ):
-    video_path = await download_and_extract_video(request.url, processed_dir)
-    video_dir = Path(video_path).parent
-    frames_dir = video_dir / "extracted_frames"
-    if not frames_dir.exists():
-        frames_dir.mkdir(parents=True, exist_ok=True)
+    if request.frame_interval <= 0:
+        raise HTTPException(status_code=400, detail="Frame interval must be greater than zero.")
+    validate_frame_batching(request.frame_batch_size, request.batch_mode)
+    from_metadata = not request.confirm_analysis and not request.precise_estimate
+    reuses_quote = request.confirm_analysis and request.quote_id
+    metadata, planned, plan = None, request, None
+    if from_metadata or (wants_plan(request) and not reuses_quote):
+        metadata = await asyncio.to_thread(probe_media, request.url, determine_source_type(request.url))
+    if wants_plan(request) and metadata is not None:
+        planned, plan = plan_video_request(request, metadata.duration, metadata.frame_size)
 
-    frames = extract_frames(video_path, str(frames_dir))
+    if from_metadata and metadata is not None:
+        # Quote from the source's duration without downloading or decoding anything
+        frame_count = expected_frame_count(
+            metadata.duration, planned.frame_interval, metadata.fps, planned.max_frames
+        )
+        estimated_tokens = (
+            estimate_frame_description_tokens(frame_count, request.frame_batch_size, request.batch_mode, metadata.frame_size)
+            + TOKENS_PER_SUMMARY_PROMPT
+            + TOKENS_PER_SUMMARY_RESPONSE
+        )
+        return VideoAnalysisResponse(
+            estimated_total_token_usage=estimated_tokens,
+            open_ai_token_counter=0,
+            plan=plan._asdict() if plan else None,
+        )
+
+    planned, plan, video_path, make_samples = await resolve_video_frames(request, user, planned, plan)
+    video_dir = Path(video_path).parent
+    frame_size = await asyncio.to_thread(probe_frame_size, video_path)
     total_tokens_used = 0  # Ensure this variable is initialized at the start of the function
-    print(len(frames))
-    estimated_tokens = len(frames) * TOKENS_PER_IMAGE + TOKENS_PER_SUMMARY_PROMPT + TOKENS_PER_SUMMARY_RESPONSE
 
     if request.confirm_analysis:
-        frame_descriptions = []
-        for frame in frames:
-            description, tokens = await asyncio.to_thread(get_frame_description, frame)
-            frame_descriptions.append(description)
-            total_tokens_used += tokens  # Accumulate tokens used for each frame
-            await asyncio.sleep(0.2)  # Delay to avoid hitting token limits
-        
+        media_key = await asyncio.to_thread(media_identity, request.url, video_path)
+        results = await describe_media_frames(
+            media_key,
+            video_frame_params(request),
+            make_samples,
+            request.frame_batch_size,
+            request.batch_mode,
+            request.use_cache,
+        )
+        frame_descriptions = [description for description, _ in results]
+        total_tokens_used += sum(tokens for _, tokens in results)  # Accumulate tokens used for each frame
+        estimated_tokens = (
+            estimate_frame_description_tokens(len(frame_descriptions), request.frame_batch_size, request.batch_mode, frame_size)
+            + TOKENS_PER_SUMMARY_PROMPT
+            + TOKENS_PER_SUMMARY_RESPONSE
+        )
+
         # Here you should correctly calculate or adjust the estimated tokens if necessary
         # For example, you might want to add the actual tokens used for frame analysis to the initial estimate
           # Adjust this line as per your logic
 
-        video_summary, summary_file_path, final_summary_total_tokens = await generate_final_summary(frame_descriptions, "", str(video_dir), request.url)
+        video_summary, summary_file_path, final_summary_total_tokens = await generate_final_summary(
+            frame_descriptions, "", str(video_dir), request.url, request.use_cache
+        )
         total_tokens_used += final_summary_total_tokens
         
         # Optionally, you can log or use total_tokens_used as needed
@@ -215,10 +603,106 @@ async def video_summary(
             estimated_total_token_usage=estimated_tokens, 
             frame_descriptions=frame_descriptions, 
             video_summary=video_summary, 
-            open_ai_token_counter=total_tokens_used
+            open_ai_token_counter=total_tokens_used,
+            plan=plan._asdict() if plan else None,
         )
     else:
+        frame_timestamps = await asyncio.to_thread(sample_timestamps, make_samples)
+        print(len(frame_timestamps))
+        estimated_tokens = (
+            estimate_frame_description_tokens(len(frame_timestamps), request.frame_batch_size, request.batch_mode, frame_size)
+            + TOKENS_PER_SUMMARY_PROMPT
+            + TOKENS_PER_SUMMARY_RESPONSE
+        )
+        quote_id = await asyncio.to_thread(
+            quote_store.create,
+            user["id"],
+            "video",
+            video_quote_params(request),
+            {"video_path": video_path, "frame_timestamps": frame_timestamps, "estimated_tokens": estimated_tokens},
+        )
         return VideoAnalysisResponse(
             estimated_total_token_usage=estimated_tokens, 
-            open_ai_token_counter=0  # Provide a default value for cases where no analysis is performed
+            open_ai_token_counter=0,  # Provide a default value for cases where no analysis is performed
+            quote_id=quote_id,
+            plan=plan._asdict() if plan else None,
         )
+
+
+@router.post("/video-summary/stream/", tags=['Summarize Video'])
+async def video_summary_stream(
+    request: VideoAnalysisRequest,
+    user: dict = Depends(get_current_user),
+    ):
+    """
+    Stream the analysis as Server-Sent Events: a "frames" event with the frame
+    descriptions, "delta" events carrying summary text as the model produces
+    it, and a closing "done" event with the full summary and token usage.
+    Streaming always runs the analysis, so confirm_analysis is ignored.
+    """
+    if request.frame_interval <= 0:
+        raise HTTPException(status_code=400, detail="Frame interval must be greater than zero.")
+    validate_frame_batching(request.frame_batch_size, request.batch_mode)
+    request = request.model_copy(update={"confirm_analysis": True})
+    planned, plan = request, None
+    if wants_plan(request) and not request.quote_id:
+        metadata = await asyncio.to_thread(probe_media, request.url, determine_source_type(request.url))
+        if metadata is not None:
+            planned, plan = plan_video_request(request, metadata.duration, metadata.frame_size)
+    planned, plan, video_path, make_samples = await resolve_video_frames(request, user, planned, plan)
+    video_dir = Path(video_path).parent
+    media_key = await asyncio.to_thread(media_identity, request.url, video_path)
+    frame_size = await asyncio.to_thread(probe_frame_size, video_path)
+
+    async def events():
+        try:
+            results = await describe_media_frames(
+                media_key,
+                video_frame_params(request),
+                make_samples,
+                request.frame_batch_size,
+                request.batch_mode,
+                request.use_cache,
+            )
+            frame_descriptions = [description for description, _ in results]
+            total_tokens_used = sum(tokens for _, tokens in results)
+            yield format_sse("frames", {"frame_descriptions": frame_descriptions, "open_ai_token_counter": total_tokens_used})
+
+            params = build_final_summary_params(frame_descriptions)
+            result = None
+            async for event in stream_chat_completion(**params, use_cache=request.use_cache):
+                if event["type"] == "delta":
+                    yield format_sse("delta", {"text": event["text"]})
+                else:
+                    result = event["result"]
+
+            video_summary = completion_text(result)
+            usage = result["usage"] or estimate_usage(params["messages"][0]["content"], video_summary, params["model"])
+            total_tokens_used += 0 if result.get("cached") else usage["total_tokens"]
+            write_final_summary(video_summary, str(video_dir), request.url)
+            db = SessionLocal()  # The request's session is closed before the stream body runs
+            try:
+                increment_ai_api_counter(user_id=user["id"], db_session=db)
+            finally:
+                db.close()
+        except HTTPException as e:
+            # Headers are already sent, so report failures in-band
+            yield format_sse("error", {"detail": e.detail})
+            return
+        except Exception as e:
+            print(f"Video summary stream failed: {e}")
+            yield format_sse("error", {"detail": f"Failed to summarize the video: {str(e)}"})
+            return
+        yield format_sse("done", {
+            "video_summary": video_summary,
+            "usage": usage,
+            "estimated_total_token_usage": (
+                estimate_frame_description_tokens(len(frame_descriptions), request.frame_batch_size, request.batch_mode, frame_size)
+                + TOKENS_PER_SUMMARY_PROMPT
+                + TOKENS_PER_SUMMARY_RESPONSE
+            ),
+            "open_ai_token_counter": total_tokens_used,
+            "plan": plan._asdict() if plan else None,
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -1,17 +1,53 @@
-from fastapi import APIRouter, HTTPException
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from functools import lru_cache
+from typing import Iterable, List, Optional
+import codecs
 import tiktoken
 from pydantic import BaseModel
 from tools.audio_video_separator import determine_source_type
 from tools.transcribe_media import process_media_transcription
+from utilities.auth import get_current_user
 
 router = APIRouter()
 
+# Uploaded files are counted this many bytes at a time
+COUNT_CHUNK_BYTES = 1024 * 1024
+# Text without whitespace is encoded anyway once this many characters pile up
+MAX_CARRY_CHARS = 4 * COUNT_CHUNK_BYTES
+
 class TokenCountResponse(BaseModel):  # Response model defined above
     model_name: str
     token_count: int
     transcription: str
 
+class TextTokenCountRequest(BaseModel):
+    text: str
+    model_name: str = "gpt-4"
+
+class BatchTokenCountRequest(BaseModel):
+    texts: List[str]
+    model_name: str = "gpt-4"
+
+class TextTokenCountResponse(BaseModel):
+    model_name: str
+    token_count: int
+
+class BatchTokenCountResponse(BaseModel):
+    model_name: str
+    token_counts: List[int]
+    total_token_count: int
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = "gpt-4") -> tiktoken.Encoding:
+    """
+    Return the tokenizer for a model. Encoders are built once per process and
+    shared, since loading one costs far more than encoding a prompt.
+    """
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown model for token counting: {model_name}")
+
 def calculate_token_count(text: str, model_name: str = "gpt-4") -> int:
     """
     Calculate the number of tokens in a given text using the specified model.
@@ -23,19 +59,76 @@ def calculate_token_count(text: str, model_name: str = "gpt-4") -> int:
     Returns:
     int: The number of tokens in the text.
     """
-    enc = tiktoken.encoding_for_model(model_name)
-    token_count = len(enc.encode(text))
-    return token_count
+    return len(get_encoding(model_name).encode(text))
+
+def calculate_token_counts(texts: List[str], model_name: str = "gpt-4") -> List[int]:
+    """Token counts of many texts, encoded in parallel threads by tiktoken."""
+    return [len(tokens) for tokens in get_encoding(model_name).encode_batch(texts)]
+
+def count_tokens_in_chunks(chunks: Iterable[bytes], model_name: str = "gpt-4") -> int:
+    """
+    Count the tokens of UTF-8 text arriving in chunks, holding only about one
+    chunk in memory. Each chunk is encoded up to the whitespace before its last
+    word, and the rest is carried into the next chunk, so words are never split
+    between two encodes.
+    """
+    enc = get_encoding(model_name)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    carry, total = "", 0
+    for chunk in chunks:
+        text = carry + decoder.decode(chunk)
+        cut = len(text)
+        while cut and not text[cut - 1].isspace():
+            cut -= 1
+        cut -= 1  # Leading whitespace belongs to the word's token
+        if cut <= 0:
+            if len(text) < MAX_CARRY_CHARS:
+                carry = text
+                continue
+            cut = len(text)
+        total += len(enc.encode(text[:cut]))
+        carry = text[cut:]
+    carry += decoder.decode(b"", final=True)
+    return total + len(enc.encode(carry))
+
+@lru_cache(maxsize=None)
+def template_token_count(template: str, model_name: str = "gpt-4") -> int:
+    """Tokens of a fixed prompt template, counted once and remembered."""
+    return calculate_token_count(template, model_name)
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str = "gpt-4") -> str:
+    """Cut `text` down to its first `max_tokens` tokens."""
+    enc = get_encoding(model_name)
+    tokens = enc.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
+
+def estimate_usage(prompt: str, completion: str, model_name: str = "gpt-4") -> dict:
+    """
+    Count prompt and completion tokens locally, in the shape of an OpenAI usage
+    block, for responses that arrive without one (such as some streams).
+    """
+    prompt_tokens = calculate_token_count(prompt, model_name)
+    completion_tokens = calculate_token_count(completion, model_name)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
 
 @router.post("/count-tokens/", tags=['Count Tokens'], response_model=TokenCountResponse)
-async def count_tokens(source_url: str, model_name: Optional[str] = "gpt-4") -> TokenCountResponse:
+async def count_tokens(
+    source_url: str, model_name: Optional[str] = "gpt-4", user: dict = Depends(get_current_user)
+) -> TokenCountResponse:
     """
     Receive a source URL, transcribe media to text, and return the token count.
     """
     source_type = determine_source_type(source_url)
     if source_type == "unsupported":
         raise HTTPException(status_code=400, detail="Unsupported URL type provided.")
-    
+    get_encoding(model_name)  # Reject unknown models before transcribing
+
     transcription, _ = await process_media_transcription(source_url, source_type)
     try:
         token_count = calculate_token_count(transcription, model_name)
@@ -43,3 +136,25 @@ async def count_tokens(source_url: str, model_name: Optional[str] = "gpt-4") ->
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/count-tokens/text/", tags=['Count Tokens'], response_model=TextTokenCountResponse)
+def count_text_tokens(request: TextTokenCountRequest, user: dict = Depends(get_current_user)) -> TextTokenCountResponse:
+    """Count the tokens of a piece of text."""
+    return TextTokenCountResponse(
+        model_name=request.model_name, token_count=calculate_token_count(request.text, request.model_name)
+    )
+
+@router.post("/count-tokens/batch/", tags=['Count Tokens'], response_model=BatchTokenCountResponse)
+def count_batch_tokens(request: BatchTokenCountRequest, user: dict = Depends(get_current_user)) -> BatchTokenCountResponse:
+    """Count the tokens of many texts in one request."""
+    token_counts = calculate_token_counts(request.texts, request.model_name)
+    return BatchTokenCountResponse(
+        model_name=request.model_name, token_counts=token_counts, total_token_count=sum(token_counts)
+    )
+
+@router.post("/count-tokens/file/", tags=['Count Tokens'], response_model=TextTokenCountResponse)
+def count_file_tokens(
+    file: UploadFile = File(...), model_name: str = "gpt-4", user: dict = Depends(get_current_user)
+) -> TextTokenCountResponse:
+    """Count the tokens of an uploaded UTF-8 text file, reading it in chunks."""
+    chunks = iter(lambda: file.file.read(COUNT_CHUNK_BYTES), b"")
+    return TextTokenCountResponse(model_name=model_name, token_count=count_tokens_in_chunks(chunks, model_name))
@@ -1,43 +1,98 @@
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import os
 from pathlib import Path
 import zipfile
 from utilities.auth import get_current_user
 from utilities.logger import log_user_activity
-from .audio_video_separator import extract_audio, determine_source_type
-from faster_whisper import WhisperModel
+from .audio_video_separator import download_media, determine_source_type
 from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import AsyncIterator, Optional
+from utilities.whisper_models import (
+    DEFAULT_TRANSCRIPTION_PROFILE,
+    TranscriptionProfile,
+    get_pool_stats,
+    get_transcription_profile,
+)
+from utilities.chunked_transcription import iter_chunked_transcription
+from utilities.inference_client import inference_server_enabled, stream_remote_transcription
+from utilities.concurrency import iterate_in_thread
+from utilities.sse import format_sse
+from utilities.media_cache import file_hash
+from utilities.media_fingerprint import media_identity
+from utilities.transcript_store import transcript_store
 
 router = APIRouter()
 PROCESSED_DIR = "processed"
 
 class TranscriptionRequest(BaseModel):
     source_url: str
+    profile: TranscriptionProfile = DEFAULT_TRANSCRIPTION_PROFILE
 
-async def transcribe_audio(audio_path: str) -> str:
-    def blocking_transcribe():
-        model = WhisperModel("base.en")
-        return " ".join([seg.text for seg in model.transcribe(audio_path)[0]])
-    return await run_in_threadpool(blocking_transcribe)
+async def stream_transcription(
+    media_path: str, profile: str = DEFAULT_TRANSCRIPTION_PROFILE, media_key: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """
+    Yield {"start", "end", "text"} segments as soon as Whisper decodes them.
+    Media already transcribed with this profile is replayed from the transcript
+    store, keyed by `media_key` (shared by near-duplicate copies of the media;
+    the file's content hash when not given), and complete new transcripts are
+    saved there.
+    """
+    options = get_transcription_profile(profile)
+    if media_key is None:
+        media_key = await run_in_threadpool(file_hash, media_path)
+    stored = await run_in_threadpool(transcript_store.get, media_key, profile)
+    if stored is not None:
+        for seg in stored:
+            yield seg
+        return
 
-async def process_media(source_url: str, source_type: str) -> Path:
-    audio_path, content_dir = await run_in_threadpool(extract_audio, source_url, source_type, PROCESSED_DIR)
-    transcription = await transcribe_audio(audio_path)
+    if inference_server_enabled():
+        segments = stream_remote_transcription(media_path, profile)
+    else:
+        segments = iterate_in_thread(lambda: iter_chunked_transcription(media_path, **options))
+    transcribed = []
+    async for seg in segments:
+        transcribed.append(seg)
+        yield seg
+    await run_in_threadpool(transcript_store.put, media_key, profile, transcribed)
+
+async def transcribe_audio(
+    media_path: str, profile: str = DEFAULT_TRANSCRIPTION_PROFILE, media_key: Optional[str] = None
+) -> str:
+    segments = [seg async for seg in stream_transcription(media_path, profile, media_key)]
+    return " ".join([seg["text"] for seg in segments])
+
+async def download_media_with_key(source_url: str, source_type: str) -> (str, str, str):
+    """Fetch the media and return its path, content directory and media key."""
+    media_path, content_dir = await run_in_threadpool(download_media, source_url, source_type, PROCESSED_DIR)
+    media_key = await run_in_threadpool(media_identity, source_url, media_path)
+    return media_path, content_dir, media_key
+
+async def process_media(source_url: str, source_type: str, profile: str = DEFAULT_TRANSCRIPTION_PROFILE) -> Path:
+    media_path, content_dir, media_key = await download_media_with_key(source_url, source_type)
+    transcription = await transcribe_audio(media_path, profile, media_key)
 
     # Save transcription to a text file inside the content directory
-    transcript_path = Path(content_dir) / (Path(audio_path).stem + '_transcription.txt')
+    transcript_path = Path(content_dir) / (Path(media_path).stem + '_transcription.txt')
     transcript_path.write_text(transcription)
 
     return content_dir
 
-async def process_media_transcription(source_url: str, source_type: str) -> Path:
-    audio_path, content_dir = await run_in_threadpool(extract_audio, source_url, source_type, PROCESSED_DIR)
-    transcription = await transcribe_audio(audio_path)
+async def process_media_transcription(source_url: str, source_type: str, profile: str = DEFAULT_TRANSCRIPTION_PROFILE) -> Path:
+    transcription, _, content_dir = await process_media_segments(source_url, source_type, profile)
     # Instead of saving to a text file, return the transcription directly
     return transcription, content_dir
 
+async def process_media_segments(source_url: str, source_type: str, profile: str = DEFAULT_TRANSCRIPTION_PROFILE) -> (str, list, str):
+    """Transcribe the media and also return the timestamped Whisper segments."""
+    media_path, content_dir, media_key = await download_media_with_key(source_url, source_type)
+    segments = [seg async for seg in stream_transcription(media_path, profile, media_key)]
+    transcription = " ".join([seg["text"] for seg in segments])
+    return transcription, segments, content_dir
+
 
 @router.post("/transcribe_media/", tags=['Create Transcription'])
 async def transcribe_media_download(
@@ -51,7 +106,7 @@ async def transcribe_media_download(
     if source_type == "unsupported":
         raise HTTPException(status_code=400, detail="Unsupported URL type provided.")
     
-    content_dir = await process_media(source_url, source_type)
+    content_dir = await process_media(source_url, source_type, extraction_request.profile)
 
     # Create a zip file of the entire content directory
     zip_filename = f"{Path(content_dir).name}.zip"
@@ -64,3 +119,51 @@ async def transcribe_media_download(
     log_user_activity(request, background_tasks, user['username'], action)
 
     return FileResponse(path=zip_file_path, media_type='application/zip', filename=zip_filename)
+
+
+@router.get("/transcribe_media/pool_stats/", tags=['Create Transcription'])
+async def transcription_pool_stats(user: dict = Depends(get_current_user)):
+    """Report occupancy and queueing of the Whisper model pools, and transcript store reuse."""
+    return {"pools": get_pool_stats(), "transcript_store": transcript_store.stats()}
+
+
+@router.post("/transcribe_media/stream/", tags=['Create Transcription'])
+async def transcribe_media_stream(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    extraction_request: TranscriptionRequest,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Stream the transcription as Server-Sent Events: one "segment" event per decoded
+    segment, followed by a "summary" event with the full text.
+    """
+    source_url = extraction_request.source_url
+    source_type = determine_source_type(source_url)
+    if source_type == "unsupported":
+        raise HTTPException(status_code=400, detail="Unsupported URL type provided.")
+    profile = extraction_request.profile
+
+    media_path, content_dir, media_key = await download_media_with_key(source_url, source_type)
+
+    async def events():
+        texts = []
+        end = 0.0
+        try:
+            async for seg in stream_transcription(media_path, profile, media_key):
+                texts.append(seg["text"])
+                end = seg["end"]
+                yield format_sse("segment", seg)
+        except HTTPException as e:
+            # Headers are already sent, so report failures in-band
+            yield format_sse("error", {"detail": e.detail})
+            return
+        transcription = " ".join(texts)
+        transcript_path = Path(content_dir) / (Path(media_path).stem + '_transcription.txt')
+        transcript_path.write_text(transcription)
+        yield format_sse("summary", {"transcript": transcription, "segment_count": len(texts), "duration": end})
+
+    action = f"Streamed transcription of media from {source_type}: {source_url}"
+    log_user_activity(request, background_tasks, user['username'], action)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,28 @@
+import av
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+def decode_audio_track(media_path: str, sampling_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Demux the first audio track of a media file (e.g. the downloaded MP4) and
+    resample it to mono float32 at `sampling_rate`, entirely in memory. Video
+    packets are skipped without being decoded and nothing is re-encoded.
+    """
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=sampling_rate)
+    chunks = []
+    with av.open(media_path, metadata_errors="ignore") as container:
+        if not container.streams.audio:
+            raise ValueError(f"No audio track found in {media_path}")
+        stream = container.streams.audio[0]
+        for packet in container.demux(stream):
+            for frame in packet.decode():
+                for resampled in resampler.resample(frame):
+                    chunks.append(resampled.to_ndarray().reshape(-1))
+        # Flush samples still buffered in the resampler
+        for resampled in resampler.resample(None):
+            chunks.append(resampled.to_ndarray().reshape(-1))
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32, copy=False)
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utilities.audio_ingest import WHISPER_SAMPLE_RATE, decode_audio_track
+from utilities.whisper_models import iter_transcription
+
+load_dotenv()  # Load environment variables from .env file
+
+SAMPLE_RATE = WHISPER_SAMPLE_RATE
+
+# Audio shorter than this is transcribed in one pass; chunking only pays off on long media
+CHUNKED_TRANSCRIPTION_MIN_SECONDS = float(os.getenv("CHUNKED_TRANSCRIPTION_MIN_SECONDS", "600"))
+# Worker processes used for chunks and the CPU threads each of them gets
+TRANSCRIPTION_PROCESSES = int(os.getenv("TRANSCRIPTION_PROCESSES", str(max(1, (os.cpu_count() or 2) // 2))))
+TRANSCRIPTION_PROCESS_THREADS = int(
+    os.getenv("TRANSCRIPTION_PROCESS_THREADS", str(max(1, (os.cpu_count() or 2) // TRANSCRIPTION_PROCESSES)))
+)
+# How far around an ideal cut point we look for the quietest spot
+SILENCE_SEARCH_SECONDS = 10.0
+# Chunks are never shorter than this, so per-chunk overhead stays small; it must
+# exceed the silence search window or cuts could land on the previous one
+MIN_CHUNK_SECONDS = max(float(os.getenv("MIN_CHUNK_SECONDS", "120")), 2 * SILENCE_SEARCH_SECONDS)
+# Audio shared by neighbouring chunks so words on a cut are decoded in full by one of them
+CHUNK_OVERLAP_SECONDS = 1.0
+# Window used to measure loudness when looking for silence
+ENERGY_FRAME_SECONDS = 0.02
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers do not inherit the server's threads or loaded models
+            _executor = ProcessPoolExecutor(
+                max_workers=TRANSCRIPTION_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def find_silence_cuts(audio: np.ndarray, chunk_seconds: float) -> List[int]:
+    """
+    Return sample offsets that split `audio` into chunks of about `chunk_seconds`,
+    moving every cut to the quietest frame within SILENCE_SEARCH_SECONDS of it.
+    """
+    if chunk_seconds <= SILENCE_SEARCH_SECONDS:
+        raise ValueError(f"Chunks must be longer than the {SILENCE_SEARCH_SECONDS}s silence search window.")
+    frame = int(ENERGY_FRAME_SECONDS * SAMPLE_RATE)
+    frame_count = len(audio) // frame
+    energy = np.sqrt(np.mean(audio[: frame_count * frame].reshape(frame_count, frame) ** 2, axis=1))
+
+    cuts = [0]
+    step = chunk_seconds * SAMPLE_RATE
+    search = int(SILENCE_SEARCH_SECONDS / ENERGY_FRAME_SECONDS)
+    while len(audio) - cuts[-1] > step * 1.5:
+        target = int((cuts[-1] + step) / frame)
+        # Every cut lies at least one frame past the previous one
+        low, high = max(target - search, cuts[-1] // frame + 1), min(target + search, frame_count)
+        quietest = low + int(np.argmin(energy[low:high]))
+        cuts.append(quietest * frame)
+    cuts.append(len(audio))
+    return cuts
+
+
+def _transcribe_chunk(audio: np.ndarray, offset: float, owned: Tuple[float, float], options: dict) -> List[dict]:
+    """Worker process entry point: transcribe one chunk and keep the segments it owns."""
+    segments = []
+    for seg in iter_transcription(audio, **options):
+        start, end = seg["start"] + offset, seg["end"] + offset
+        # A segment spanning a cut is decoded by both neighbours; keep it only once
+        if owned[0] <= (start + end) / 2 < owned[1]:
+            segments.append({"start": start, "end": end, "text": seg["text"]})
+    return segments
+
+
+def iter_chunked_transcription(media_path: str, **options) -> Iterator[dict]:
+    """
+    Transcribe the audio track of `media_path` and yield segments in order.
+    Long audio is split at silences and the chunks are decoded in parallel
+    worker processes, with segment timestamps shifted back onto the original
+    timeline.
+    """
+    audio = decode_audio_track(media_path, SAMPLE_RATE)
+    duration = len(audio) / SAMPLE_RATE
+    if duration < CHUNKED_TRANSCRIPTION_MIN_SECONDS or TRANSCRIPTION_PROCESSES < 2:
+        yield from iter_transcription(audio, **options)
+        return
+
+    chunk_seconds = max(duration / TRANSCRIPTION_PROCESSES, MIN_CHUNK_SECONDS)
+    cuts = find_silence_cuts(audio, chunk_seconds)
+    overlap = int(CHUNK_OVERLAP_SECONDS * SAMPLE_RATE)
+    chunk_options = {**options, "cpu_threads": TRANSCRIPTION_PROCESS_THREADS}
+
+    pool = get_process_pool()
+    futures = []
+    for cut_start, cut_end in zip(cuts, cuts[1:]):
+        start = max(cut_start - overlap, 0)
+        end = min(cut_end + overlap, len(audio))
+        owned = (cut_start / SAMPLE_RATE, cut_end / SAMPLE_RATE if cut_end < len(audio) else float("inf"))
+        futures.append(pool.submit(_transcribe_chunk, audio[start:end], start / SAMPLE_RATE, owned, chunk_options))
+
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Callable, Iterator
+
+
+async def iterate_in_thread(make_iterator: Callable[[], Iterator], maxsize: int = 0) -> AsyncIterator:
+    """
+    Run a blocking iterator in a worker thread and yield its items on the event
+    loop as they are produced. With `maxsize` set, the producer waits whenever
+    the consumer falls that many items behind. Each iterator gets its own
+    daemon thread rather than one from the default executor, since a producer
+    waiting on its consumer would otherwise hold a thread that the consumer's
+    own asyncio.to_thread calls need.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item, error=None):
+        asyncio.run_coroutine_threadsafe(queue.put((item, error)), loop).result()
+
+    def produce():
+        try:
+            for item in make_iterator():
+                if stop.is_set():
+                    return
+                put(item)
+        except Exception as e:
+            if not stop.is_set():
+                put(done, e)
+            return
+        if not stop.is_set():
+            put(done)
+
+    threading.Thread(target=produce, name="iterate-in-thread", daemon=True).start()
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Unblock a producer waiting on a full queue so it can notice the stop flag
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
@@ -0,0 +1,103 @@
+import math
+import re
+from typing import List
+
+import numpy as np
+from fastapi import HTTPException
+
+# Share of the transcript's sentences kept, within the bounds below
+SUMMARY_SENTENCE_RATIO = 0.1
+MIN_SUMMARY_SENTENCES = 3
+MAX_SUMMARY_SENTENCES = 12
+# Unpunctuated transcripts are cut into pseudo-sentences of this many words
+FALLBACK_SENTENCE_WORDS = 30
+# TextRank damping factor and power-iteration limits
+DAMPING = 0.85
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-6
+
+SUMMARY_MODES = ("llm", "local")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[a-z0-9']+")
+_STOP_WORDS = frozenset(
+    """
+    a about after again all also am an and any are as at be because been before being both but by
+    can could did do does doing down during each few for from further had has have having he her here
+    hers him his how i if in into is it its itself just like me more most my no nor not now of off on
+    once only or other our ours out over own really right same she should so some such than that the
+    their theirs them then there these they this those through to too um uh under until up very was we
+    well were what when where which while who whom why will with would yeah you your yours
+    """.split()
+)
+
+
+def validate_summary_mode(mode: str):
+    if mode not in SUMMARY_MODES:
+        raise HTTPException(status_code=400, detail="Mode must be 'llm' or 'local'.")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split on sentence punctuation, falling back to fixed word windows for unpunctuated text."""
+    sentences = [s.strip() for s in _SENTENCE_END.split(text.strip()) if s.strip()]
+    if len(sentences) > 1:
+        return sentences
+    words = text.split()
+    return [" ".join(words[i:i + FALLBACK_SENTENCE_WORDS]) for i in range(0, len(words), FALLBACK_SENTENCE_WORDS)]
+
+
+def tfidf_matrix(sentences: List[str]) -> np.ndarray:
+    """Rows are L2-normalised TF-IDF vectors of the sentences, stop words excluded."""
+    vocabulary = {}
+    rows, columns = [], []
+    for row, sentence in enumerate(sentences):
+        for word in _WORD.findall(sentence.lower()):
+            if word in _STOP_WORDS:
+                continue
+            rows.append(row)
+            columns.append(vocabulary.setdefault(word, len(vocabulary)))
+
+    counts = np.zeros((len(sentences), max(len(vocabulary), 1)), dtype=np.float32)
+    np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)), 1.0)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    weights = counts * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+
+
+def textrank_scores(vectors: np.ndarray) -> np.ndarray:
+    """PageRank over the cosine-similarity graph of the sentence vectors."""
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    # Sentences sharing no words with any other link to every sentence equally
+    transition = np.divide(
+        similarity, out_weight, out=np.full_like(similarity, 1 / len(similarity)), where=out_weight > 0
+    )
+    scores = np.full(len(similarity), 1 / len(similarity), dtype=np.float32)
+    for _ in range(MAX_ITERATIONS):
+        updated = (1 - DAMPING) / len(similarity) + DAMPING * (transition.T @ scores)
+        converged = np.abs(updated - scores).sum() < TOLERANCE
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def extractive_summary(text: str, max_sentences: int = None) -> str:
+    """
+    Summarize `text` by picking its most central sentences with TextRank over
+    TF-IDF similarity, returned in their original order. Runs locally with no
+    model calls.
+    """
+    sentences = split_sentences(text)
+    if max_sentences is None:
+        max_sentences = math.ceil(len(sentences) * SUMMARY_SENTENCE_RATIO)
+        max_sentences = min(max(max_sentences, MIN_SUMMARY_SENTENCES), MAX_SUMMARY_SENTENCES)
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+
+    scores = textrank_scores(tfidf_matrix(sentences))
+    keep = np.sort(np.argsort(-scores, kind="stable")[:max_sentences])
+    return " ".join(sentences[i] for i in keep)
@@ -0,0 +1,55 @@
+import base64
+import os
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from utilities.frame_sampler import SampledFrame
+from utilities.token_budget import detail_size
+
+load_dotenv()  # Load environment variables from .env file
+
+FRAME_JPEG_QUALITY = int(os.getenv("FRAME_JPEG_QUALITY", "80"))
+# Detail level frames are sent at: "low" (flat cost) or "high" (tiled, reads small text)
+VISION_DETAIL = os.getenv("VISION_DETAIL", "low")
+
+
+class PreparedFrame(NamedTuple):
+    index: int
+    timestamp: float
+    image: np.ndarray  # BGR pixels, downscaled to what the vision model sees
+    base64_jpeg: str  # What is sent to the vision model
+    path: Optional[str] = None  # Full-resolution copy on disk, when one was written
+
+
+def downscale_for_detail(image: np.ndarray, detail: str = VISION_DETAIL) -> np.ndarray:
+    """Shrink an image to the size the vision model rescales it to at `detail`, so no upload is wasted."""
+    height, width = image.shape[:2]
+    size = detail_size(width, height, detail)
+    if size == (width, height):
+        return image
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_jpeg_base64(image: np.ndarray, quality: int = FRAME_JPEG_QUALITY) -> str:
+    success, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError("Failed to encode frame as JPEG.")
+    return base64.b64encode(buffer.tobytes()).decode("utf-8")
+
+
+def prepare_frame(sampled: SampledFrame, output_folder: Optional[str] = None) -> PreparedFrame:
+    """
+    Downscale a sampled frame to the size VISION_DETAIL is billed at and
+    JPEG/base64-encode it in memory. The full-resolution frame is only written
+    when `output_folder` is given.
+    """
+    path = None
+    if output_folder is not None:
+        path = str(Path(output_folder) / f"frame_{sampled.index}.jpg")
+        cv2.imwrite(path, sampled.image)
+    small = downscale_for_detail(sampled.image)
+    return PreparedFrame(sampled.index, sampled.timestamp, small, encode_jpeg_base64(small), path)
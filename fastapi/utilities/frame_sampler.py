@@ -0,0 +1,132 @@
+import os
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import av
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+# Sampling intervals at or above this use seeking instead of walking every frame;
+# below it a seek would re-decode most of the GOP we just skipped anyway
+SEEK_INTERVAL_SECONDS = float(os.getenv("SEEK_INTERVAL_SECONDS", "4"))
+# Frame rate assumed when a container reports neither fps nor timestamps
+FALLBACK_FPS = 30.0
+
+
+class SampledFrame(NamedTuple):
+    index: int  # Position among the sampled frames
+    timestamp: float  # Seconds from the start of the video
+    image: np.ndarray  # BGR pixels, as returned by OpenCV
+
+
+def iter_frames(video_path: str, interval_seconds: float = 1.0, keyframes_only: bool = False) -> Iterator[SampledFrame]:
+    """
+    Yield one frame every `interval_seconds` of presentation time. Frames
+    between sample points are skipped without colour conversion (or seeked
+    over for sparse sampling). With `keyframes_only`, only I-frames are decoded
+    and the first keyframe at or after each sample point is used.
+    """
+    if keyframes_only:
+        yield from _iter_keyframes(video_path, interval_seconds)
+    elif interval_seconds >= SEEK_INTERVAL_SECONDS:
+        yield from _iter_frames_by_seeking(video_path, interval_seconds)
+    else:
+        yield from _iter_frames_by_grabbing(video_path, interval_seconds)
+
+
+def _iter_frames_by_grabbing(video_path: str, interval_seconds: float) -> Iterator[SampledFrame]:
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    try:
+        position, index, next_sample = 0, 0, 0.0
+        while cap.grab():
+            # Container timestamps keep variable-frame-rate files on the right clock
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if timestamp <= 0 and position > 0:
+                timestamp = position / (fps if fps > 0 else FALLBACK_FPS)
+            position += 1
+            if timestamp + 1e-3 < next_sample:
+                continue
+            success, image = cap.retrieve()
+            if not success:
+                break
+            yield SampledFrame(index, timestamp, image)
+            index += 1
+            while next_sample <= timestamp + 1e-3:
+                next_sample += interval_seconds
+    finally:
+        cap.release()
+
+
+def _iter_frames_by_seeking(video_path: str, interval_seconds: float) -> Iterator[SampledFrame]:
+    cap = cv2.VideoCapture(video_path)
+    try:
+        index, target = 0, 0.0
+        while True:
+            if target > 0:
+                cap.set(cv2.CAP_PROP_POS_MSEC, target * 1000)
+            success, image = cap.read()
+            if not success:
+                break
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 or target
+            yield SampledFrame(index, timestamp, image)
+            index += 1
+            target += interval_seconds
+    finally:
+        cap.release()
+
+
+def iter_frames_at(video_path: str, timestamps: Iterable[float]) -> Iterator[SampledFrame]:
+    """Seek to each of `timestamps` in turn, e.g. to replay a selection made earlier."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        for index, target in enumerate(timestamps):
+            cap.set(cv2.CAP_PROP_POS_MSEC, target * 1000)
+            success, image = cap.read()
+            if not success:
+                break
+            yield SampledFrame(index, target, image)
+    finally:
+        cap.release()
+
+
+def _iter_keyframes(video_path: str, interval_seconds: float) -> Iterator[SampledFrame]:
+    with av.open(video_path, metadata_errors="ignore") as container:
+        stream = container.streams.video[0]
+        stream.codec_context.skip_frame = "NONKEY"
+        index, next_sample = 0, 0.0
+        for frame in container.decode(stream):
+            timestamp = frame.time if frame.time is not None else next_sample
+            if timestamp + 1e-3 < next_sample:
+                continue
+            yield SampledFrame(index, timestamp, frame.to_ndarray(format="bgr24"))
+            index += 1
+            next_sample = timestamp + interval_seconds
+
+
+def probe_duration(video_path: str) -> Optional[float]:
+    """Read the video duration in seconds from the container header, if it has one."""
+    try:
+        with av.open(video_path, metadata_errors="ignore") as container:
+            if container.duration:
+                return container.duration / av.time_base
+            stream = container.streams.video[0]
+            if stream.duration and stream.time_base:
+                return float(stream.duration * stream.time_base)
+    except (av.AVError, IndexError):
+        pass
+    return None
+
+
+def probe_frame_size(video_path: str) -> Optional[Tuple[int, int]]:
+    """Read the width and height of the first video stream from the container header."""
+    try:
+        with av.open(video_path, metadata_errors="ignore") as container:
+            stream = container.streams.video[0]
+            if stream.width and stream.height:
+                return stream.width, stream.height
+    except (av.AVError, IndexError):
+        pass
+    return None
@@ -0,0 +1,182 @@
+import os
+from typing import Iterable, Iterator, List, Optional
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from utilities.frame_sampler import SampledFrame
+
+load_dotenv()  # Load environment variables from .env file
+
+# Hamming distance (out of 64 bits) between frame hashes that counts as a new scene
+SCENE_CHANGE_THRESHOLD = int(os.getenv("SCENE_CHANGE_THRESHOLD", "10"))
+DEFAULT_MIN_FRAMES = int(os.getenv("DEFAULT_MIN_FRAMES", "3"))
+DEFAULT_MAX_FRAMES = int(os.getenv("DEFAULT_MAX_FRAMES", "100"))
+# Speech-free stretches longer than this get a frame every GAP_SAMPLE_SECONDS
+GAP_SAMPLE_SECONDS = float(os.getenv("GAP_SAMPLE_SECONDS", "5"))
+# Segment boundaries closer together than this share one frame
+MIN_TARGET_SPACING_SECONDS = 2.0
+
+
+def difference_hash(image: np.ndarray, hash_size: int = 8) -> np.ndarray:
+    """64-bit perceptual difference hash of a BGR or grayscale image, as a bool array."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return (small[:, 1:] > small[:, :-1]).reshape(-1)
+
+
+def hamming_distance(a: np.ndarray, b: np.ndarray) -> int:
+    return int(np.count_nonzero(a != b))
+
+
+class FrameSelector:
+    """
+    Decides frame by frame whether a sampled frame shows something new.
+
+    A frame is kept when its perceptual hash differs from the last kept frame
+    by at least `threshold` bits. When the video `duration` is known, kept
+    frames are spaced at least duration / max_frames apart, and a frame is
+    forced through whenever duration / min_frames passes without one, so the
+    result stays within [min_frames, max_frames] without buffering frames.
+    Without a duration nothing is capped here; thin the kept frames with
+    thin_evenly instead, so the cap does not cut off the end of the video.
+    """
+
+    def __init__(
+        self,
+        threshold: int = SCENE_CHANGE_THRESHOLD,
+        min_frames: int = DEFAULT_MIN_FRAMES,
+        max_frames: int = DEFAULT_MAX_FRAMES,
+        duration: Optional[float] = None,
+    ):
+        self.threshold = threshold
+        self.max_frames = max_frames
+        self.min_gap = duration / max_frames if duration and max_frames else 0.0
+        self.max_gap = duration / min_frames if duration and min_frames else None
+        self.kept = 0
+        self._last_hash = None
+        self._last_timestamp = None
+
+    def accept(self, image: np.ndarray, timestamp: float) -> bool:
+        if self.min_gap and self.kept >= self.max_frames:
+            return False
+        frame_hash = difference_hash(image)
+        if self._last_hash is not None:
+            gap = timestamp - self._last_timestamp
+            if gap < self.min_gap:
+                return False
+            overdue = self.max_gap is not None and gap >= self.max_gap
+            if not overdue and hamming_distance(frame_hash, self._last_hash) < self.threshold:
+                return False
+        self._last_hash = frame_hash
+        self._last_timestamp = timestamp
+        self.kept += 1
+        return True
+
+
+def thin_evenly(items: Iterable, max_frames: int) -> list:
+    """
+    Keep `max_frames` of `items`, spread evenly over all of them. Every
+    stride-th item is buffered, and the stride doubles whenever the buffer
+    passes 2 * max_frames, so memory stays bounded however many items arrive.
+    Pass frame timestamps rather than frames to keep the buffer small.
+    """
+    kept, stride = [], 1
+    for position, item in enumerate(items):
+        if position % stride:
+            continue
+        kept.append(item)
+        if len(kept) > 2 * max_frames:
+            kept = kept[::2]
+            stride *= 2
+    if len(kept) <= max_frames:
+        return kept
+    # Thin evenly rather than truncating, so the end of the video is still covered
+    picks = np.linspace(0, len(kept) - 1, max_frames).round().astype(int)
+    return [kept[i] for i in sorted(set(picks))]
+
+
+def expected_frame_count(
+    duration: float,
+    interval_seconds: Optional[float] = None,
+    fps: Optional[float] = None,
+    max_frames: int = DEFAULT_MAX_FRAMES,
+) -> int:
+    """
+    Upper estimate of the frames a sampler keeps from a video of `duration`
+    seconds, for quoting costs before the video is decoded. Without an
+    interval this estimates transcript-guided sampling, which keeps at most one
+    frame every MIN_TARGET_SPACING_SECONDS.
+    """
+    spacing = interval_seconds if interval_seconds else MIN_TARGET_SPACING_SECONDS
+    if fps:
+        spacing = max(spacing, 1 / fps)
+    count = int(duration // spacing) + 1
+    return min(count, max_frames) if max_frames else count
+
+
+def transcript_guided_timestamps(segments: List[dict], duration: Optional[float], max_frames: int = DEFAULT_MAX_FRAMES) -> List[float]:
+    """
+    Pick frame timestamps from Whisper segments: one at the start of every
+    segment, plus one every GAP_SAMPLE_SECONDS through stretches without speech
+    (including before the first and after the last segment).
+    """
+    targets = []
+    previous_end = 0.0
+    for seg in segments:
+        gap_time = previous_end + GAP_SAMPLE_SECONDS
+        while gap_time < seg["start"]:
+            targets.append(gap_time)
+            gap_time += GAP_SAMPLE_SECONDS
+        targets.append(seg["start"])
+        previous_end = max(previous_end, seg["end"])
+    if duration:
+        gap_time = previous_end + GAP_SAMPLE_SECONDS
+        while gap_time < duration:
+            targets.append(gap_time)
+            gap_time += GAP_SAMPLE_SECONDS
+    if not targets:
+        targets.append(0.0)
+
+    spaced = []
+    for target in sorted(targets):
+        if not spaced or target - spaced[-1] >= MIN_TARGET_SPACING_SECONDS:
+            spaced.append(target)
+    if max_frames and len(spaced) > max_frames:
+        # Thin evenly rather than truncating, so the end of the video is still covered
+        picks = np.linspace(0, len(spaced) - 1, max_frames).round().astype(int)
+        spaced = [spaced[i] for i in sorted(set(picks))]
+    return spaced
+
+
+def select_guided_frames(
+    samples: Iterable[SampledFrame],
+    targets: List[float],
+    scene_change_threshold: int = SCENE_CHANGE_THRESHOLD,
+    max_frames: int = DEFAULT_MAX_FRAMES,
+) -> Iterator[SampledFrame]:
+    """
+    From a dense stream of samples, keep the first sample at or after each
+    target timestamp, plus any sample that is a visual scene change relative to
+    the last kept frame. Scene changes only fill whatever is left of max_frames
+    after the targets.
+    """
+    pending = sorted(targets)
+    extra_budget = max(max_frames - len(pending), 0) if max_frames else None
+    position = 0
+    last_hash = None
+    for sampled in samples:
+        hit = False
+        while position < len(pending) and pending[position] <= sampled.timestamp + 1e-3:
+            position += 1
+            hit = True
+        frame_hash = difference_hash(sampled.image)
+        if not hit and scene_change_threshold > 0 and last_hash is not None and extra_budget != 0:
+            if hamming_distance(frame_hash, last_hash) >= scene_change_threshold:
+                hit = True
+                if extra_budget is not None:
+                    extra_budget -= 1
+        if hit:
+            last_hash = frame_hash
+            yield sampled
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()  # Load environment variables from .env file
+
+# Address of the shared Whisper inference server, either "unix:/path/to/socket"
+# or "host:port". When unset, every API worker transcribes in-process.
+WHISPER_INFERENCE_ADDR = os.getenv("WHISPER_INFERENCE_ADDR", "")
+
+
+def parse_inference_addr(addr: str) -> Tuple[str, Optional[str], Optional[int]]:
+    """Split an inference address into ("unix", path, None) or ("tcp", host, port)."""
+    if addr.startswith("unix:"):
+        return "unix", addr[len("unix:"):], None
+    host, _, port = addr.rpartition(":")
+    return "tcp", host or "127.0.0.1", int(port)
+
+
+def inference_server_enabled() -> bool:
+    return bool(WHISPER_INFERENCE_ADDR)
+
+
+async def _open_connection():
+    kind, host_or_path, port = parse_inference_addr(WHISPER_INFERENCE_ADDR)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(host_or_path, limit=2**20)
+    return await asyncio.open_connection(host_or_path, port, limit=2**20)
+
+
+async def stream_remote_transcription(audio_path: str, profile: str) -> AsyncIterator[dict]:
+    """
+    Send a transcription job to the inference server and yield its segments as
+    they arrive. Only the profile name is sent; the server resolves it against
+    its own model configuration. The server answers with one JSON message per line.
+    """
+    try:
+        reader, writer = await _open_connection()
+    except OSError as e:
+        raise HTTPException(status_code=503, detail=f"Transcription service unavailable: {str(e)}")
+
+    try:
+        job = {"audio_path": os.path.abspath(audio_path), "profile": profile}
+        writer.write(json.dumps(job).encode("utf-8") + b"\n")
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise HTTPException(status_code=502, detail="Transcription service closed the connection.")
+            message = json.loads(line)
+            if message["type"] == "segment":
+                yield message["segment"]
+            elif message["type"] == "done":
+                return
+            else:
+                raise HTTPException(status_code=502, detail=f"Transcription failed: {message.get('detail')}")
+    finally:
+        writer.close()
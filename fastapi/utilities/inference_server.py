@@ -0,0 +1,171 @@
+"""
+Shared Whisper inference server.
+
+Run one instance next to the API workers (`python -m utilities.inference_server`)
+and point them at it with WHISPER_INFERENCE_ADDR. The server owns the Whisper
+model pools, so model memory is paid once, and a single scheduler decides which
+job runs next instead of every worker competing for the same cores.
+"""
+import asyncio
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from utilities.inference_client import WHISPER_INFERENCE_ADDR, parse_inference_addr
+from utilities.chunked_transcription import iter_chunked_transcription
+from utilities.frame_sampler import probe_duration
+from utilities.whisper_models import (
+    DEFAULT_TRANSCRIPTION_PROFILE,
+    configured_pool_capacity,
+    get_transcription_profile,
+    preload_models,
+)
+
+# Rough media bitrate used to estimate the duration of files whose header has none
+INFERENCE_BYTES_PER_SECOND = int(os.getenv("INFERENCE_BYTES_PER_SECOND", "16000"))
+# Number of jobs decoded at once; defaults to the total size of the configured pools
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(configured_pool_capacity() or 1)))
+
+
+class TranscriptionJob:
+    def __init__(self, options: dict, loop: asyncio.AbstractEventLoop):
+        self.options = options
+        self.loop = loop
+        self.messages = asyncio.Queue()
+        self.submitted_at = time.monotonic()
+        self.expected_seconds = expected_duration(options["audio_path"])
+        self.cancelled = False
+
+    def send(self, message: dict):
+        self.loop.call_soon_threadsafe(self.messages.put_nowait, message)
+
+    def cancel(self):
+        """Drop the job: skipped if still queued, stopped at its next segment if running."""
+        self.cancelled = True
+
+
+def expected_duration(audio_path: str) -> float:
+    """Media duration from the container header, else estimated from the file size."""
+    duration = probe_duration(audio_path)
+    if duration:
+        return duration
+    try:
+        return os.path.getsize(audio_path) / INFERENCE_BYTES_PER_SECOND
+    except OSError:
+        return 0
+
+
+class Scheduler:
+    """
+    Orders jobs from every API worker by expected finish time (submission time
+    plus expected decode time), so short reels are not stuck behind hour-long
+    videos while long jobs still age their way to the front.
+    """
+
+    def __init__(self, workers: int):
+        self.jobs = asyncio.PriorityQueue()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = asyncio.Semaphore(workers)
+        self._sequence = itertools.count()
+
+    def submit(self, job: TranscriptionJob):
+        priority = job.submitted_at + job.expected_seconds
+        self.jobs.put_nowait((priority, next(self._sequence), job))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self.jobs.get()
+            if job.cancelled:
+                continue
+            await self.slots.acquire()
+            if job.cancelled:
+                self.slots.release()
+                continue
+            loop.run_in_executor(self.executor, self._transcribe, job)
+
+    def _transcribe(self, job: TranscriptionJob):
+        try:
+            self._decode(job)
+        finally:
+            # Freed only once the worker thread is done, so a slot always means a busy thread
+            job.loop.call_soon_threadsafe(self.slots.release)
+
+    @staticmethod
+    def _decode(job: TranscriptionJob):
+        audio_path = job.options["audio_path"]
+        if job.cancelled:
+            return
+        try:
+            options = get_transcription_profile(job.options.get("profile", DEFAULT_TRANSCRIPTION_PROFILE))
+        except HTTPException as e:
+            job.send({"type": "error", "detail": e.detail})
+            return
+        segments = iter_chunked_transcription(audio_path, **options)
+        try:
+            for segment in segments:
+                if job.cancelled:
+                    print(f"Inference job for {audio_path} cancelled")
+                    return
+                job.send({"type": "segment", "segment": segment})
+            job.send({"type": "done"})
+        except Exception as e:
+            job.send({"type": "error", "detail": str(e)})
+        finally:
+            segments.close()  # Cancels chunks still waiting in the process pool
+
+
+async def handle_connection(scheduler: Scheduler, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    job = hangup = None
+    try:
+        line = await reader.readline()
+        if not line:
+            return
+        job = TranscriptionJob(json.loads(line), asyncio.get_running_loop())
+        scheduler.submit(job)
+        # Clients send nothing after the request, so EOF means they went away
+        hangup = asyncio.ensure_future(reader.read())
+        while True:
+            message = asyncio.ensure_future(job.messages.get())
+            await asyncio.wait({message, hangup}, return_when=asyncio.FIRST_COMPLETED)
+            if not message.done():
+                message.cancel()
+                print("Inference client disconnected; cancelling its job")
+                break
+            message = message.result()
+            writer.write(json.dumps(message).encode("utf-8") + b"\n")
+            await writer.drain()
+            if message["type"] != "segment":
+                break
+    except (ConnectionError, json.JSONDecodeError) as e:
+        print(f"Inference connection dropped: {str(e)}")
+    finally:
+        if hangup is not None:
+            hangup.cancel()
+        if job is not None:
+            job.cancel()  # No-op once the job has finished
+        writer.close()
+
+
+async def serve(addr: str):
+    scheduler = Scheduler(INFERENCE_WORKERS)
+    handler = lambda reader, writer: handle_connection(scheduler, reader, writer)
+    kind, host_or_path, port = parse_inference_addr(addr)
+    if kind == "unix":
+        if os.path.exists(host_or_path):
+            os.remove(host_or_path)
+        server = await asyncio.start_unix_server(handler, path=host_or_path)
+    else:
+        server = await asyncio.start_server(handler, host_or_path, port)
+    print(f"Whisper inference server listening on {addr} with {INFERENCE_WORKERS} workers")
+    async with server:
+        await asyncio.gather(server.serve_forever(), scheduler.run())
+
+
+if __name__ == "__main__":
+    preload_models()
+    asyncio.run(serve(WHISPER_INFERENCE_ADDR or "unix:/tmp/typhon-whisper.sock"))
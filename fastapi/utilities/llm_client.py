@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from utilities.llm_cache import llm_cache
+from utilities.rate_limiter import RateLimiter, backoff_delay
+
+load_dotenv()  # Load environment variables from .env file
+
+# Point this at a local stand-in server for tests and benchmarks
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+LLM_API_KEY = os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+_usage = defaultdict(lambda: defaultdict(int))
+_usage_lock = threading.Lock()
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide HTTP client, whose connection pool is reused across requests."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=LLM_BASE_URL,
+            headers={"Authorization": f"Bearer {LLM_API_KEY}"},
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def record_usage(model: str, usage: dict):
+    with _usage_lock:
+        totals = _usage[model]
+        totals["requests"] += 1
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            totals[key] += usage.get(key, 0)
+
+
+def billed_tokens(result: dict) -> int:
+    """Tokens a completion result was billed for; answers from the cache cost none."""
+    return 0 if result.get("cached") else result["usage"]["total_tokens"]
+
+
+def get_usage_stats() -> dict:
+    """Requests and tokens used per model since the process started."""
+    with _usage_lock:
+        return {model: dict(totals) for model, totals in _usage.items()}
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def chat_completion(
+    model: str,
+    messages: List[dict],
+    max_tokens: int,
+    temperature: float,
+    use_cache: bool = True,
+    rate_limiter: Optional[RateLimiter] = None,
+    estimated_tokens: int = 0,
+) -> dict:
+    """
+    Create a chat completion and return the response body. Identical requests
+    are answered from the persistent cache unless `use_cache` is False. Only
+    requests that reach the provider wait on `rate_limiter`, for
+    `estimated_tokens`. Rate limits, server errors and timeouts are retried
+    with jittered exponential backoff; anything still failing after
+    LLM_MAX_RETRIES is raised as an HTTPException.
+    """
+    cache_key = llm_cache.fingerprint(model, messages, max_tokens, temperature)
+    if use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+    if rate_limiter is not None:
+        await rate_limiter.acquire(estimated_tokens)
+
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    client = get_client()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        last_attempt = attempt == LLM_MAX_RETRIES
+        try:
+            response = await client.post("/chat/completions", json=payload)
+        except httpx.TransportError as e:
+            if last_attempt:
+                raise HTTPException(status_code=504, detail=f"LLM request failed: {str(e)}")
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code == 200:
+            result = response.json()
+            record_usage(model, result.get("usage", {}))
+            # Bypassed requests still refresh the cache with the new answer
+            await asyncio.to_thread(llm_cache.put, cache_key, result)
+            return result
+        if response.status_code not in RETRYABLE_STATUS_CODES or last_attempt:
+            status_code = 429 if response.status_code == 429 else 502
+            raise HTTPException(status_code=status_code, detail=f"LLM request failed ({response.status_code}): {response.text}")
+        await asyncio.sleep(_retry_after(response) or backoff_delay(attempt))
+
+
+async def discard_completion(model: str, messages: List[dict], max_tokens: int, temperature: float):
+    """Drop the cached answer to a request the caller found unusable, so it is asked afresh next time."""
+    await asyncio.to_thread(llm_cache.delete, llm_cache.fingerprint(model, messages, max_tokens, temperature))
+
+
+async def stream_chat_completion(
+    model: str, messages: List[dict], max_tokens: int, temperature: float, use_cache: bool = True
+) -> AsyncIterator[dict]:
+    """
+    Stream a chat completion as {"type": "delta", "text": ...} events, ending
+    with {"type": "done", "result": ...} where the result has the same shape
+    as a chat_completion response. Its usage is None when the server does not
+    report usage for streams. Only opening the stream is retried; a cached
+    answer is replayed as a single delta.
+    """
+    cache_key = llm_cache.fingerprint(model, messages, max_tokens, temperature)
+    if use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, cache_key)
+        if cached is not None:
+            yield {"type": "delta", "text": completion_text(cached)}
+            yield {"type": "done", "result": {**cached, "cached": True}}
+            return
+
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    client = get_client()
+    parts = []
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        last_attempt = attempt == LLM_MAX_RETRIES
+        try:
+            async with client.stream("POST", "/chat/completions", json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    if response.status_code not in RETRYABLE_STATUS_CODES or last_attempt:
+                        status_code = 429 if response.status_code == 429 else 502
+                        raise HTTPException(status_code=status_code, detail=f"LLM request failed ({response.status_code}): {body}")
+                    await asyncio.sleep(_retry_after(response) or backoff_delay(attempt))
+                    continue
+
+                usage = None
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get("usage") or usage
+                    for choice in chunk.get("choices", []):
+                        text = choice.get("delta", {}).get("content")
+                        if text:
+                            parts.append(text)
+                            yield {"type": "delta", "text": text}
+        except httpx.TransportError as e:
+            # Once text has reached the caller a retry would repeat it
+            if last_attempt or parts:
+                raise HTTPException(status_code=504, detail=f"LLM request failed: {str(e)}")
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        result = {
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}}],
+            "usage": usage,
+        }
+        if usage:
+            record_usage(model, usage)
+            await asyncio.to_thread(llm_cache.put, cache_key, result)
+        yield {"type": "done", "result": result}
+        return
+
+
+def completion_text(result: dict) -> str:
+    return result["choices"][0]["message"]["content"]
@@ -0,0 +1,344 @@
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "processed/media_cache")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+# Files handed out to requests are kept at least this long after their last hand-out;
+# it should outlast the longest request and QUOTE_TTL_SECONDS, since quotes keep paths
+MEDIA_LINK_LEASE_SECONDS = float(os.getenv("MEDIA_LINK_LEASE_SECONDS", str(6 * 3600)))
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_YOUTUBE_ID = re.compile(r"^[\w-]{11}$")
+_YOUTUBE_PATH = re.compile(r"^/(?:shorts|embed|live|v)/([\w-]{11})")
+_INSTAGRAM_PATH = re.compile(r"^/(?:[\w.]+/)?(?:p|reels?|tv)/([\w-]+)")
+
+
+def canonical_source_id(url: str) -> Optional[str]:
+    """
+    Identify the media a URL points at as "youtube:<video id>" or
+    "instagram:<shortcode>", whichever URL form was used (watch, youtu.be,
+    shorts, embed and mobile links; posts, reels and TV). None for anything else.
+    """
+    parsed = urlparse(url.strip() if "://" in url else "https://" + url.strip())
+    host = (parsed.hostname or "").lower()
+    if host.endswith("instagram.com"):
+        match = _INSTAGRAM_PATH.match(parsed.path)
+        return f"instagram:{match.group(1)}" if match else None
+    if host == "youtu.be":
+        video_id = parsed.path.strip("/").split("/")[0]
+    elif host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+        match = _YOUTUBE_PATH.match(parsed.path)
+        video_id = match.group(1) if match else parse_qs(parsed.query).get("v", [""])[0]
+    else:
+        return None
+    return f"youtube:{video_id}" if _YOUTUBE_ID.match(video_id) else None
+
+
+def canonical_url(source_id: str) -> str:
+    """The one URL downloads of a source go through."""
+    platform, key = source_id.split(":", 1)
+    if platform == "youtube":
+        return f"https://www.youtube.com/watch?v={key}"
+    return f"https://www.instagram.com/p/{key}/"
+
+
+def source_dir_name(source_id: str) -> str:
+    """Directory and file stem for a source's outputs, e.g. "youtube_dQw4w9WgXcQ"."""
+    return source_id.replace(":", "_")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_file(source: str, destination: str) -> bool:
+    """
+    Hard-link `source` to `destination`, replacing what is there. Falls back to
+    a copy across filesystems; returns False when the file was copied.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return True
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    staged = f"{destination}.{threading.get_ident()}.tmp"
+    try:
+        os.link(source, staged)
+        linked = True
+    except OSError:
+        shutil.copyfile(source, staged)
+        linked = False
+    os.replace(staged, destination)
+    return linked
+
+
+class CachedMedia(NamedTuple):
+    source_id: str
+    content_hash: str  # SHA-256 of the file
+    path: str
+    filename: str  # Name the file was downloaded under, e.g. the video title
+
+
+class MediaCache:
+    """
+    Disk cache of downloaded media. Files are stored once under their content
+    hash, and an SQLite index maps each source (a canonical source ID plus a
+    variant such as "video" or "archive") to its file. Callers get a hard link
+    to the cached file, so evicting the cached copy never pulls a file from
+    under a request. Every file handed out is recorded with a lease that each
+    new hand-out renews. Once the lease has run out and the file's object is
+    evicted, the file is deleted too. Copies, and links that outlive their
+    object, count against `max_bytes`. Once that is exceeded the least recently
+    used objects are evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, lease_seconds: float = MEDIA_LINK_LEASE_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lease_seconds = lease_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._downloads = {}  # (source_id, variant) -> [lock held while it downloads, requests waiting on it]
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.directory, "index.db"), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                "source_id TEXT NOT NULL, variant TEXT NOT NULL, content_hash TEXT NOT NULL, "
+                "filename TEXT NOT NULL, PRIMARY KEY (source_id, variant))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS objects ("
+                "content_hash TEXT PRIMARY KEY, suffix TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS objects_accessed ON objects (accessed)")
+            if "filename" not in [row[1] for row in self._conn.execute("PRAGMA table_info(sources)")]:
+                # Indexes written before download names were kept
+                self._conn.execute("ALTER TABLE sources ADD COLUMN filename TEXT NOT NULL DEFAULT ''")
+            # Files handed out from an object; copied ones take their own space on disk
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS links ("
+                "path TEXT PRIMARY KEY, content_hash TEXT NOT NULL, size INTEGER NOT NULL, "
+                "copied INTEGER NOT NULL DEFAULT 0, leased REAL NOT NULL DEFAULT 0)"
+            )
+            link_columns = [row[1] for row in self._conn.execute("PRAGMA table_info(links)")]
+            if "leased" not in link_columns:
+                # Indexes written before leases; their hard links were recorded with size 0
+                self._conn.execute("ALTER TABLE links ADD COLUMN copied INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("ALTER TABLE links ADD COLUMN leased REAL NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE links SET copied = 1 WHERE size > 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS links_content_hash ON links (content_hash)")
+            self._conn.commit()
+        return self._conn
+
+    def _object_path(self, content_hash: str, suffix: str) -> str:
+        return os.path.join(self.directory, "objects", content_hash + suffix)
+
+    def _lookup(self, conn: sqlite3.Connection, source_id: str, variant: str) -> Optional[CachedMedia]:
+        row = conn.execute(
+            "SELECT o.content_hash, o.suffix, s.filename FROM sources s JOIN objects o ON o.content_hash = s.content_hash "
+            "WHERE s.source_id = ? AND s.variant = ?",
+            (source_id, variant),
+        ).fetchone()
+        if row is None:
+            return None
+        path = self._object_path(row[0], row[1])
+        if not os.path.exists(path):
+            # Deleted outside the cache; forget it
+            self._forget(conn, row[0])
+            conn.commit()
+            return None
+        conn.execute("UPDATE objects SET accessed = ? WHERE content_hash = ?", (time.time(), row[0]))
+        conn.commit()
+        return CachedMedia(source_id, row[0], path, row[2] or os.path.basename(path))
+
+    def lookup(self, source_id: str, variant: str = "video") -> Optional[CachedMedia]:
+        with self._lock:
+            return self._lookup(self._connection(), source_id, variant)
+
+    def _record(self, conn: sqlite3.Connection, path: str, content_hash: str, copied: bool):
+        conn.execute(
+            "INSERT OR REPLACE INTO links (path, content_hash, size, copied, leased) VALUES (?, ?, ?, ?, ?)",
+            (os.path.abspath(path), content_hash, os.path.getsize(path), int(copied), time.time()),
+        )
+
+    def _link(self, conn: sqlite3.Connection, cached: CachedMedia, destination: str):
+        linked = link_file(cached.path, destination)
+        self._record(conn, destination, cached.content_hash, copied=not linked)
+        conn.commit()
+
+    def track(self, path: str, content_hash: str):
+        """
+        Record, or renew the lease of, a file derived from a cached object, such
+        as one unpacked from a cached archive, so it counts against the budget
+        and is deleted once its lease has run out and the object is evicted.
+        """
+        with self._lock:
+            conn = self._connection()
+            self._record(conn, path, content_hash, copied=True)
+            self._evict(conn, keep=content_hash)
+            conn.commit()
+
+    def store(
+        self, source_id: str, path: str, variant: str = "video", destination: Optional[str] = None
+    ) -> CachedMedia:
+        """
+        Move a downloaded file into the cache and index it under `source_id`,
+        linking it to `destination` before anything can evict it.
+        """
+        content_hash = file_hash(path)
+        filename = os.path.basename(path)
+        suffix = Path(path).suffix
+        object_path = self._object_path(content_hash, suffix)
+        cached = CachedMedia(source_id, content_hash, object_path, filename)
+        with self._lock:
+            conn = self._connection()
+            if os.path.exists(object_path):
+                os.remove(path)  # Same bytes already cached under another source
+            else:
+                shutil.move(path, object_path)
+            conn.execute(
+                "INSERT OR REPLACE INTO objects (content_hash, suffix, size, accessed) VALUES (?, ?, ?, ?)",
+                (content_hash, suffix, os.path.getsize(object_path), time.time()),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (source_id, variant, content_hash, filename) VALUES (?, ?, ?, ?)",
+                (source_id, variant, content_hash, filename),
+            )
+            if destination is not None:
+                self._link(conn, cached, destination)
+            self._evict(conn, keep=content_hash)
+            conn.commit()
+        return cached
+
+    def _forget(self, conn: sqlite3.Connection, content_hash: str):
+        # Its links stay recorded until their leases run out
+        conn.execute("DELETE FROM objects WHERE content_hash = ?", (content_hash,))
+        conn.execute("DELETE FROM sources WHERE content_hash = ?", (content_hash,))
+
+    def _disk_usage(self, conn: sqlite3.Connection) -> int:
+        return conn.execute(
+            "SELECT (SELECT COALESCE(SUM(size), 0) FROM objects) + (SELECT COALESCE(SUM(size), 0) FROM links "
+            "WHERE copied OR content_hash NOT IN (SELECT content_hash FROM objects))"
+        ).fetchone()[0]
+
+    def _remove_expired_links(self, conn: sqlite3.Connection, content_hash: Optional[str] = None):
+        """Delete the files handed out from evicted objects, or from `content_hash`, whose leases have run out."""
+        expired = time.time() - self.lease_seconds
+        if content_hash is None:
+            where, params = "content_hash NOT IN (SELECT content_hash FROM objects)", (expired,)
+        else:
+            where, params = "content_hash = ?", (content_hash, expired)
+        rows = conn.execute(f"SELECT path FROM links WHERE {where} AND leased < ?", params).fetchall()
+        for (path,) in rows:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM links WHERE path = ?", (path,))
+
+    def _evict(self, conn: sqlite3.Connection, keep: str):
+        self._remove_expired_links(conn)
+        if self._disk_usage(conn) <= self.max_bytes:
+            return
+        for content_hash, suffix in conn.execute(
+            "SELECT content_hash, suffix FROM objects ORDER BY accessed"
+        ).fetchall():
+            if content_hash == keep:
+                continue
+            leased = conn.execute(
+                "SELECT 1 FROM links WHERE content_hash = ? AND NOT copied AND leased >= ?",
+                (content_hash, time.time() - self.lease_seconds),
+            ).fetchone()
+            if leased:
+                continue  # Its leased hard links hold the same bytes, so evicting it frees nothing
+            try:
+                os.remove(self._object_path(content_hash, suffix))
+            except FileNotFoundError:
+                pass
+            self._forget(conn, content_hash)
+            self._remove_expired_links(conn, content_hash)
+            if self._disk_usage(conn) <= self.max_bytes:
+                break
+
+    def fetch(
+        self, source_id: str, download: Callable[[str], str], destination: str, variant: str = "video"
+    ) -> CachedMedia:
+        """
+        Link the cached file for a source to `destination`, downloading it
+        first on a miss. `download` gets a scratch directory and returns the
+        path of the file it fetched there. Concurrent requests for the same
+        source share one download.
+        """
+        key = (source_id, variant)
+        with self._lock:
+            pending = self._downloads.setdefault(key, [threading.Lock(), 0])
+            pending[1] += 1
+        try:
+            with pending[0]:
+                with self._lock:
+                    conn = self._connection()
+                    cached = self._lookup(conn, source_id, variant)
+                    if cached is not None:
+                        self.hits += 1
+                        self._link(conn, cached, destination)
+                        return cached._replace(path=destination)
+                    self.misses += 1
+                os.makedirs(self.directory, exist_ok=True)
+                with tempfile.TemporaryDirectory(dir=self.directory) as scratch:
+                    print(f"Media cache miss for {source_id}; downloading")
+                    cached = self.store(source_id, download(scratch), variant, destination)
+                return cached._replace(path=destination)
+        finally:
+            with self._lock:
+                pending[1] -= 1
+                if pending[1] == 0:
+                    del self._downloads[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            entries = conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+            size = self._disk_usage(conn)
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_bytes": size,
+            }
+
+
+media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES)
+
+
+def media_content_hash(url: str, path: str) -> str:
+    """
+    Content hash of a source's fetched file, read from the cache index when the
+    file is still the cached one, and computed from the file otherwise.
+    """
+    source_id = canonical_source_id(url)
+    cached = media_cache.lookup(source_id) if source_id else None
+    if cached is not None and os.path.exists(path) and os.path.samefile(cached.path, path):
+        return cached.content_hash
+    return file_hash(path)
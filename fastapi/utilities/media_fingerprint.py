@@ -0,0 +1,219 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utilities.audio_ingest import decode_audio_track
+from utilities.frame_sampler import iter_frames_at, probe_duration
+from utilities.frame_selection import difference_hash
+from utilities.media_cache import media_content_hash
+
+load_dotenv()  # Load environment variables from .env file
+
+MEDIA_INDEX_PATH = os.getenv("MEDIA_INDEX_PATH", "processed/media_index.db")
+
+# Frames hashed per video, spread evenly over its duration
+FINGERPRINT_FRAMES = 16
+# Bins of the audio energy signature, spread evenly over the duration
+AUDIO_ENERGY_BINS = 64
+# Audio is decoded at this rate for the signature; energy needs no more
+AUDIO_ENERGY_SAMPLE_RATE = 8000
+# Near-duplicates: durations within the larger of these, frame hashes within this
+# mean Hamming distance (of 64 bits), and audio signatures at least this correlated
+DURATION_TOLERANCE_SECONDS = 1.0
+DURATION_TOLERANCE_RATIO = 0.02
+MAX_FRAME_HASH_DISTANCE = 10
+MIN_AUDIO_CORRELATION = 0.9
+
+
+class Fingerprint(NamedTuple):
+    duration: float
+    frame_hashes: List[int]  # 64-bit dHash of each sampled frame
+    audio_energy: Optional[List[float]]  # Standardized log energy per bin, None without an audio track
+
+
+def frame_dhash(image: np.ndarray) -> int:
+    """The frame's difference hash packed into a 64-bit integer."""
+    return int(np.packbits(difference_hash(image)).view(">u8")[0])
+
+
+def audio_energy_signature(media_path: str) -> Optional[List[float]]:
+    """Log RMS energy of the audio in AUDIO_ENERGY_BINS equal slices, standardized to zero mean and unit variance."""
+    try:
+        audio = decode_audio_track(media_path, AUDIO_ENERGY_SAMPLE_RATE)
+    except ValueError:
+        return None  # No audio track
+    if len(audio) < AUDIO_ENERGY_BINS:
+        return None
+    bins = np.array_split(audio, AUDIO_ENERGY_BINS)
+    energy = np.log1p(np.array([np.sqrt(np.mean(np.square(b))) for b in bins]) * 1000)
+    spread = energy.std()
+    if spread == 0:
+        return None  # Silence carries no signature
+    return [round(float(e), 3) for e in (energy - energy.mean()) / spread]
+
+
+def compute_fingerprint(media_path: str) -> Optional[Fingerprint]:
+    """Hash FINGERPRINT_FRAMES evenly spaced frames and summarize the audio energy of a video."""
+    duration = probe_duration(media_path)
+    if not duration:
+        return None
+    timestamps = [(i + 0.5) * duration / FINGERPRINT_FRAMES for i in range(FINGERPRINT_FRAMES)]
+    frame_hashes = [frame_dhash(sampled.image) for sampled in iter_frames_at(media_path, timestamps)]
+    if not frame_hashes:
+        return None
+    return Fingerprint(duration, frame_hashes, audio_energy_signature(media_path))
+
+
+def is_near_duplicate(a: Fingerprint, b: Fingerprint) -> bool:
+    tolerance = max(DURATION_TOLERANCE_SECONDS, DURATION_TOLERANCE_RATIO * max(a.duration, b.duration))
+    if abs(a.duration - b.duration) > tolerance:
+        return False
+    pairs = list(zip(a.frame_hashes, b.frame_hashes))
+    if not pairs:
+        return False
+    distance = sum(bin(x ^ y).count("1") for x, y in pairs) / len(pairs)
+    if distance > MAX_FRAME_HASH_DISTANCE:
+        return False
+    if (a.audio_energy is None) != (b.audio_energy is None):
+        return False
+    if a.audio_energy is not None:
+        return float(np.corrcoef(a.audio_energy, b.audio_energy)[0, 1]) >= MIN_AUDIO_CORRELATION
+    return True
+
+
+class MediaIndex:
+    """
+    SQLite index of media fingerprints and of results derived from the media.
+    Each file (by content hash) maps to a media key: the content hash of the
+    first near-duplicate seen, or its own. Results stored under a media key,
+    such as frame descriptions, are reused for every repost of that media.
+    Files that could not be fingerprinted are indexed without a fingerprint,
+    under their own key, so they are not decoded again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            columns = {row[1]: row[3] for row in self._conn.execute("PRAGMA table_info(fingerprints)")}
+            if columns.get("duration"):
+                # Indexes written before failed fingerprints were kept have NOT NULL columns
+                self._conn.execute("ALTER TABLE fingerprints RENAME TO fingerprints_old")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "content_hash TEXT PRIMARY KEY, media_key TEXT NOT NULL, duration REAL, "
+                "frame_hashes TEXT, audio_energy TEXT, created REAL NOT NULL)"
+            )
+            if columns.get("duration"):
+                self._conn.execute("INSERT INTO fingerprints SELECT * FROM fingerprints_old")
+                self._conn.execute("DROP TABLE fingerprints_old")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_duration ON fingerprints (duration)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "media_key TEXT NOT NULL, kind TEXT NOT NULL, params TEXT NOT NULL, result TEXT NOT NULL, "
+                "created REAL NOT NULL, PRIMARY KEY (media_key, kind, params))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _params(params: dict) -> str:
+        return json.dumps(params, sort_keys=True)
+
+    def media_key(self, content_hash: str) -> Optional[str]:
+        """The media key of an indexed file, or None when it has not been fingerprinted."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT media_key FROM fingerprints WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def find_match(self, fingerprint: Fingerprint) -> Optional[str]:
+        """Media key of an indexed near-duplicate of `fingerprint`, if there is one."""
+        tolerance = max(DURATION_TOLERANCE_SECONDS, DURATION_TOLERANCE_RATIO * fingerprint.duration)
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT media_key, duration, frame_hashes, audio_energy FROM fingerprints "
+                "WHERE duration BETWEEN ? AND ? ORDER BY created",
+                (fingerprint.duration - tolerance, fingerprint.duration + tolerance),
+            ).fetchall()
+        for media_key, duration, frame_hashes, audio_energy in rows:
+            candidate = Fingerprint(duration, json.loads(frame_hashes), json.loads(audio_energy) if audio_energy else None)
+            if is_near_duplicate(fingerprint, candidate):
+                return media_key
+        return None
+
+    def register(self, content_hash: str, fingerprint: Optional[Fingerprint]) -> str:
+        """Index a file's fingerprint, None when it has none, and return its media key."""
+        media_key = (self.find_match(fingerprint) if fingerprint is not None else None) or content_hash
+        if media_key != content_hash:
+            print(f"Media {content_hash} is a near-duplicate of {media_key}; reusing its results")
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO fingerprints "
+                "(content_hash, media_key, duration, frame_hashes, audio_energy, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    content_hash,
+                    media_key,
+                    fingerprint.duration if fingerprint is not None else None,
+                    json.dumps(fingerprint.frame_hashes) if fingerprint is not None else None,
+                    json.dumps(fingerprint.audio_energy) if fingerprint and fingerprint.audio_energy is not None else None,
+                    time.time(),
+                ),
+            )
+            conn.commit()
+            row = conn.execute("SELECT media_key FROM fingerprints WHERE content_hash = ?", (content_hash,)).fetchone()
+        return row[0]
+
+    def get_result(self, media_key: str, kind: str, params: dict):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT result FROM results WHERE media_key = ? AND kind = ? AND params = ?",
+                (media_key, kind, self._params(params)),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_result(self, media_key: str, kind: str, params: dict, result):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (media_key, kind, params, result, created) VALUES (?, ?, ?, ?, ?)",
+                (media_key, kind, self._params(params), json.dumps(result), time.time()),
+            )
+            conn.commit()
+
+
+media_index = MediaIndex(MEDIA_INDEX_PATH)
+
+
+def media_identity(url: str, path: str) -> str:
+    """
+    Media key of a fetched source: fingerprinted the first time its file is
+    seen, so a repost of known media maps to the key its results are stored
+    under. Falls back to the file's content hash when it cannot be fingerprinted.
+    Decodes and hashes the file, so async callers run it in a worker thread.
+    """
+    content_hash = media_content_hash(url, path)
+    media_key = media_index.media_key(content_hash)
+    if media_key is not None:
+        return media_key
+    try:
+        fingerprint = compute_fingerprint(path)
+    except Exception as e:
+        print(f"Fingerprinting {path} failed: {e}")
+        fingerprint = None
+    return media_index.register(content_hash, fingerprint)
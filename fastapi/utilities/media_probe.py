@@ -0,0 +1,94 @@
+import math
+import os
+from typing import NamedTuple, Optional, Tuple
+
+import av
+import instaloader
+from dotenv import load_dotenv
+from pytube import YouTube
+
+from utilities.media_cache import canonical_source_id
+
+load_dotenv()  # Load environment variables from .env file
+
+# Transcript tokens per second of media; ~150 spoken words a minute at ~1.3 tokens a word
+TRANSCRIPT_TOKENS_PER_SECOND = float(os.getenv("TRANSCRIPT_TOKENS_PER_SECOND", "3.3"))
+# Header probes of remote media give up after this many seconds
+PROBE_TIMEOUT_SECONDS = 5
+
+# Metadata requests only; nothing is downloaded through this instance
+_instagram = instaloader.Instaloader(download_pictures=False, download_videos=False, save_metadata=False)
+
+
+class MediaMetadata(NamedTuple):
+    duration: float  # Seconds
+    fps: Optional[float] = None
+    video_url: Optional[str] = None  # Direct media URL, when the source exposes one
+    frame_size: Optional[Tuple[int, int]] = None  # Width and height in pixels
+
+
+def probe_container(url: str) -> Optional[MediaMetadata]:
+    """
+    Read duration, frame rate and size from a media file's container header. Remote
+    files are opened over HTTP, which fetches the header rather than the file.
+    """
+    options = {"timeout": str(PROBE_TIMEOUT_SECONDS * 1_000_000)}  # Microseconds
+    try:
+        with av.open(url, options=options, metadata_errors="ignore") as container:
+            stream = container.streams.video[0] if container.streams.video else None
+            duration = container.duration / av.time_base if container.duration else None
+            if duration is None and stream is not None and stream.duration and stream.time_base:
+                duration = float(stream.duration * stream.time_base)
+            if not duration:
+                return None
+            fps = float(stream.average_rate) if stream is not None and stream.average_rate else None
+            frame_size = (stream.width, stream.height) if stream is not None and stream.width else None
+            return MediaMetadata(duration, fps, url, frame_size)
+    except (av.AVError, OSError):
+        return None
+
+
+def probe_youtube(url: str) -> Optional[MediaMetadata]:
+    yt = YouTube(url)
+    video = yt.streams.get_highest_resolution()
+    fps = getattr(video, "fps", None) if video else None
+    frame_size = None
+    if video and video.resolution:
+        # Progressive YouTube streams are 16:9
+        height = int(video.resolution.rstrip("p"))
+        frame_size = (round(height * 16 / 9), height)
+    if yt.length:
+        return MediaMetadata(float(yt.length), fps, video.url if video else None, frame_size)
+    return probe_container(video.url) if video else None
+
+
+def probe_instagram(url: str) -> Optional[MediaMetadata]:
+    source_id = canonical_source_id(url)
+    if source_id is None or not source_id.startswith("instagram:"):
+        return None
+    post = instaloader.Post.from_shortcode(_instagram.context, source_id.split(":", 1)[1])
+    if not post.is_video:
+        return None
+    if post.video_duration:
+        return MediaMetadata(float(post.video_duration), None, post.video_url)
+    return probe_container(post.video_url)
+
+
+def probe_media(url: str, source_type: str) -> Optional[MediaMetadata]:
+    """
+    Look up a source's duration (and frame rate, where available) from the
+    platform's metadata without downloading the media. Returns None when the
+    metadata cannot be read, so callers can fall back to the full pipeline.
+    """
+    try:
+        if source_type == "youtube":
+            return probe_youtube(url)
+        if source_type == "instagram":
+            return probe_instagram(url)
+    except Exception as e:
+        print(f"Metadata probe failed for {url}: {e}")
+    return None
+
+
+def estimate_transcript_tokens(duration: float) -> int:
+    return math.ceil(duration * TRANSCRIPT_TOKENS_PER_SECOND)
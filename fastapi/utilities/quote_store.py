@@ -0,0 +1,84 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()  # Load environment variables from .env file
+
+QUOTE_STORE_PATH = os.getenv("QUOTE_STORE_PATH", "processed/quotes.db")
+QUOTE_TTL_SECONDS = float(os.getenv("QUOTE_TTL_SECONDS", "3600"))
+
+
+class QuoteStore:
+    """
+    SQLite-backed store of the artifacts an estimate produced (transcripts,
+    sampled frame timestamps, file paths, token counts), so the confirming
+    request can skip straight to the LLM stages. Quotes belong to the user who
+    requested them and expire after `ttl` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quotes ("
+                "id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, kind TEXT NOT NULL, "
+                "params TEXT NOT NULL, artifacts TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _params(params: dict) -> str:
+        return json.dumps(params, sort_keys=True)
+
+    def create(self, user_id: int, kind: str, params: dict, artifacts: dict) -> str:
+        """Store the artifacts of an estimate and return the new quote ID."""
+        quote_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM quotes WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "INSERT INTO quotes (id, user_id, kind, params, artifacts, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (quote_id, user_id, kind, self._params(params), json.dumps(artifacts), now),
+            )
+            conn.commit()
+        return quote_id
+
+    def redeem(self, quote_id: str, user_id: int, kind: str, params: dict) -> Optional[dict]:
+        """
+        Return the artifacts of a quote, or None when it has expired or is not
+        this user's, in which case the caller redoes the work. A quote made for
+        different parameters is rejected, as its artifacts would not apply.
+        Quotes stay valid until they expire, so a failed confirmation can be
+        retried with the same ID.
+        """
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT user_id, kind, params, artifacts, created FROM quotes WHERE id = ?", (quote_id,)
+            ).fetchone()
+        if row is None or row[0] != user_id or row[1] != kind or time.time() - row[4] > self.ttl:
+            print(f"Quote {quote_id} not found or expired; processing from scratch")
+            return None
+        if row[2] != self._params(params):
+            raise HTTPException(status_code=409, detail="Quote was issued for different request parameters.")
+        return json.loads(row[3])
+
+
+quote_store = QuoteStore(QUOTE_STORE_PATH, QUOTE_TTL_SECONDS)
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+# Provider limits for the vision model; keep a little under the account's real limits
+VISION_REQUESTS_PER_MINUTE = int(os.getenv("VISION_REQUESTS_PER_MINUTE", "100"))
+VISION_TOKENS_PER_MINUTE = int(os.getenv("VISION_TOKENS_PER_MINUTE", "30000"))
+
+
+class TokenBucket:
+    """Async token bucket holding at most `capacity` tokens, refilled continuously."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # A request larger than the bucket could never be served, so let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.refill_per_second)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits applied together."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+vision_rate_limiter = RateLimiter(VISION_REQUESTS_PER_MINUTE, VISION_TOKENS_PER_MINUTE)
@@ -0,0 +1,6 @@
+import json
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,119 @@
+import math
+import os
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()  # Load environment variables from .env file
+
+# Vision token accounting for gpt-4-vision: a flat cost for "low" detail, and
+# 512px tiles of the rescaled image for "high" detail
+LOW_DETAIL_SIZE = 512  # "low" detail requests see the image at most 512x512
+LOW_DETAIL_IMAGE_TOKENS = 85
+HIGH_DETAIL_BASE_TOKENS = 85
+HIGH_DETAIL_TILE_TOKENS = 170
+HIGH_DETAIL_TILE_SIZE = 512
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+
+# Frame size assumed for pricing when a source does not report one
+ASSUMED_FRAME_SIZE = (1920, 1080)
+# Share of a token budget the transcript may take before frames get the rest
+TRANSCRIPT_BUDGET_SHARE = float(os.getenv("TRANSCRIPT_BUDGET_SHARE", "0.5"))
+# Latency model for planning against a target: seconds per vision request, per
+# final summary request, and transcription time as a fraction of media duration
+VISION_REQUEST_SECONDS = float(os.getenv("VISION_REQUEST_SECONDS", "5"))
+SUMMARY_REQUEST_SECONDS = float(os.getenv("SUMMARY_REQUEST_SECONDS", "20"))
+TRANSCRIPTION_REAL_TIME_FACTOR = float(os.getenv("TRANSCRIPTION_REAL_TIME_FACTOR", "0.15"))
+
+
+class BudgetPlan(NamedTuple):
+    frame_interval: Optional[float]  # Seconds between sampled frames, None to keep the sampler's own spacing
+    max_frames: int
+    transcript_tokens: Optional[int]  # Transcript tokens the summary may use, None when it fits whole
+    estimated_tokens: int
+    estimated_seconds: float
+
+
+def detail_size(width: int, height: int, detail: str = "low") -> tuple:
+    """Size a vision model sees an image at for the given detail level."""
+    limit = HIGH_DETAIL_MAX_SIDE if detail == "high" else LOW_DETAIL_SIZE
+    scale = min(1.0, limit / max(width, height))
+    if detail == "high":
+        scale = min(scale, HIGH_DETAIL_SHORT_SIDE / min(width * scale, height * scale) * scale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def image_tokens(width: int, height: int, detail: str = "low") -> int:
+    """Input tokens one image of `width` x `height` pixels costs at the given detail level."""
+    if detail != "high":
+        return LOW_DETAIL_IMAGE_TOKENS
+    width, height = detail_size(width, height, "high")
+    tiles = math.ceil(width / HIGH_DETAIL_TILE_SIZE) * math.ceil(height / HIGH_DETAIL_TILE_SIZE)
+    return HIGH_DETAIL_BASE_TOKENS + tiles * HIGH_DETAIL_TILE_TOKENS
+
+
+def plan_budget(
+    duration: float,
+    fixed_tokens: int,
+    frame_tokens: float,
+    transcript_tokens: int = 0,
+    token_budget: Optional[int] = None,
+    target_latency_seconds: Optional[float] = None,
+    frame_interval: Optional[float] = None,
+    max_frames: int = 0,
+    frames_per_request: int = 1,
+    concurrent_requests: int = 1,
+    transcribes: bool = True,
+) -> BudgetPlan:
+    """
+    Fit a summary job to a token budget and a target latency.
+
+    `fixed_tokens` is what the job costs with no frames and an empty transcript,
+    and `frame_tokens` the added cost of each frame, its description included.
+    The transcript may take up to TRANSCRIPT_BUDGET_SHARE of what the budget
+    leaves, frames take what remains, and any tokens the frames do not use go
+    back to the transcript. The frame count is also capped by the number of
+    vision request rounds that fit in the latency target. The requested
+    interval and frame cap are only ever tightened.
+    """
+    frames = max_frames
+    if frame_interval:
+        by_interval = int(duration // frame_interval) + 1
+        frames = min(frames, by_interval) if frames else by_interval
+    wants_frames = frames > 0
+
+    fixed_seconds = SUMMARY_REQUEST_SECONDS
+    if transcribes:
+        fixed_seconds += duration * TRANSCRIPTION_REAL_TIME_FACTOR
+    if target_latency_seconds is not None and wants_frames:
+        # Latency is a soft target: at least one frame is always kept
+        rounds = max(int((target_latency_seconds - fixed_seconds) // VISION_REQUEST_SECONDS), 1)
+        frames = min(frames, rounds * concurrent_requests * frames_per_request)
+
+    transcript_limit = None
+    if token_budget is not None:
+        available = token_budget - fixed_tokens
+        if available < (frame_tokens if wants_frames else 0):
+            minimum = fixed_tokens + (math.ceil(frame_tokens) if wants_frames else 0)
+            raise HTTPException(status_code=400, detail=f"Token budget too small; this job needs at least {minimum} tokens.")
+        transcript_share = min(transcript_tokens, int(available * TRANSCRIPT_BUDGET_SHARE) if wants_frames else available)
+        if wants_frames:
+            frames = max(min(frames, int((available - transcript_share) // frame_tokens)), 1)
+        transcript_budget = int(available - frames * frame_tokens)
+        if transcript_budget < transcript_tokens:
+            transcript_limit = max(transcript_budget, 0)
+
+    used_transcript = transcript_tokens if transcript_limit is None else transcript_limit
+    rounds = math.ceil(math.ceil(frames / frames_per_request) / concurrent_requests) if frames else 0
+    interval = None
+    if frame_interval and frames:
+        interval = max(frame_interval, duration / frames)
+    return BudgetPlan(
+        frame_interval=interval,
+        max_frames=frames,
+        transcript_tokens=transcript_limit,
+        estimated_tokens=math.ceil(fixed_tokens + frames * frame_tokens + used_transcript),
+        estimated_seconds=fixed_seconds + rounds * VISION_REQUEST_SECONDS,
+    )
@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+TRANSCRIPT_STORE_PATH = os.getenv("TRANSCRIPT_STORE_PATH", "processed/transcripts.db")
+TRANSCRIPT_STORE_MAX_BYTES = int(os.getenv("TRANSCRIPT_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class TranscriptStore:
+    """
+    SQLite-backed store of Whisper transcripts, keyed by the SHA-256 of the
+    media file and the transcription profile. Near-duplicate copies of media
+    share the hash of the first copy seen. Segments keep their timestamps and
+    are stored as zlib-compressed JSON. Once the stored blobs exceed
+    `max_bytes` the least recently used transcripts are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "content_hash TEXT NOT NULL, profile TEXT NOT NULL, segments BLOB NOT NULL, "
+                "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL, "
+                "PRIMARY KEY (content_hash, profile))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS transcripts_accessed ON transcripts (accessed)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, content_hash: str, profile: str) -> Optional[List[dict]]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT segments FROM transcripts WHERE content_hash = ? AND profile = ?", (content_hash, profile)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE transcripts SET accessed = ? WHERE content_hash = ? AND profile = ?",
+                (time.time(), content_hash, profile),
+            )
+            conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, content_hash: str, profile: str, segments: List[dict]):
+        blob = zlib.compress(json.dumps(segments, separators=(",", ":")).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts (content_hash, profile, segments, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, profile, blob, len(blob), now, now),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for content_hash, profile, size in conn.execute(
+            "SELECT content_hash, profile, size FROM transcripts ORDER BY accessed"
+        ).fetchall():
+            conn.execute("DELETE FROM transcripts WHERE content_hash = ? AND profile = ?", (content_hash, profile))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_bytes": size,
+            }
+
+
+transcript_store = TranscriptStore(TRANSCRIPT_STORE_PATH, TRANSCRIPT_STORE_MAX_BYTES)
@@ -0,0 +1,222 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Literal, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from faster_whisper import WhisperModel
+
+load_dotenv()  # Load environment variables from .env file
+
+# Comma-separated "model_size:compute_type:cpu_threads:pool_size" entries that are
+# loaded at startup, e.g. "base.en:int8:4:2,tiny.en:int8:2:1"
+WHISPER_MODELS = os.getenv("WHISPER_MODELS", "base.en:int8:0:1")
+# Pool size used for model configurations that were not listed in WHISPER_MODELS
+WHISPER_DEFAULT_POOL_SIZE = int(os.getenv("WHISPER_DEFAULT_POOL_SIZE", "1"))
+# Threads per model instance used by the transcription profiles (0 lets CTranslate2 decide)
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+
+ModelKey = Tuple[str, str, int]
+
+DEFAULT_TRANSCRIPTION_PROFILE = "balanced"
+# Request field type, so unknown profiles are rejected before any download
+TranscriptionProfile = Literal["fast", "balanced", "accurate"]
+
+# Named speed/accuracy trade-offs selectable per request. "fast" targets short
+# reels: smallest model, int8 weights, greedy decoding and VAD so silence and
+# music are skipped instead of decoded.
+TRANSCRIPTION_PROFILES = {
+    "fast": {
+        "model_size": "tiny.en",
+        "compute_type": "int8",
+        "beam_size": 1,
+        "best_of": 1,
+        "vad_filter": True,
+    },
+    "balanced": {
+        "model_size": "base.en",
+        "compute_type": "int8",
+        "beam_size": 2,
+        "best_of": 2,
+        "vad_filter": True,
+    },
+    "accurate": {
+        "model_size": "small.en",
+        "compute_type": "default",
+        "beam_size": 5,
+        "best_of": 5,
+        "vad_filter": False,
+    },
+}
+
+
+def get_transcription_profile(name: str) -> dict:
+    """
+    Resolve a profile name into iter_transcription keyword arguments. With the
+    inference server enabled this runs on the server, so model pools are keyed
+    by its own WHISPER_CPU_THREADS and match its WHISPER_MODELS.
+    """
+    profile = TRANSCRIPTION_PROFILES.get(name)
+    if profile is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown transcription profile '{name}'. Choose one of: {', '.join(TRANSCRIPTION_PROFILES)}.",
+        )
+    return {"cpu_threads": WHISPER_CPU_THREADS, **profile}
+
+
+def parse_model_config(config: str) -> List[Tuple[ModelKey, int]]:
+    """Parse the WHISPER_MODELS setting into (model key, pool size) pairs."""
+    entries = []
+    for entry in config.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        parts = entry.split(":")
+        model_size = parts[0]
+        compute_type = parts[1] if len(parts) > 1 and parts[1] else "default"
+        cpu_threads = int(parts[2]) if len(parts) > 2 and parts[2] else 0
+        pool_size = int(parts[3]) if len(parts) > 3 and parts[3] else WHISPER_DEFAULT_POOL_SIZE
+        entries.append(((model_size, compute_type, cpu_threads), max(pool_size, 1)))
+    return entries
+
+
+class WhisperModelPool:
+    """
+    A bounded pool of ready WhisperModel instances sharing one configuration.
+    Instances are created on demand up to `size`; once all of them are busy,
+    callers queue until one is released.
+    """
+
+    def __init__(self, key: ModelKey, size: int):
+        self.key = key
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._acquisitions = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _load_model(self) -> WhisperModel:
+        model_size, compute_type, cpu_threads = self.key
+        print(f"Loading Whisper model {model_size} (compute_type={compute_type}, cpu_threads={cpu_threads})")
+        return WhisperModel(model_size, compute_type=compute_type, cpu_threads=cpu_threads)
+
+    def warm(self):
+        """Load every instance of the pool up front."""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            try:
+                self._idle.put(self._load_model())
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a model from the pool, blocking while every instance is busy."""
+        started = time.monotonic()
+        model = None
+        create = False
+        with self._lock:
+            self._waiting += 1
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                create = True
+        try:
+            if create:
+                try:
+                    model = self._load_model()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                model = self._idle.get()
+        finally:
+            waited = time.monotonic() - started
+            with self._lock:
+                self._waiting -= 1
+                if model is not None:
+                    self._in_use += 1
+                    self._acquisitions += 1
+                    # Model loading is not queueing, so only count time spent blocked
+                    if not create:
+                        self._total_wait += waited
+                        self._max_wait = max(self._max_wait, waited)
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(model)
+
+    def stats(self) -> dict:
+        with self._lock:
+            model_size, compute_type, cpu_threads = self.key
+            return {
+                "model_size": model_size,
+                "compute_type": compute_type,
+                "cpu_threads": cpu_threads,
+                "pool_size": self.size,
+                "loaded": self._created,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "acquisitions": self._acquisitions,
+                "average_wait_seconds": self._total_wait / self._acquisitions if self._acquisitions else 0.0,
+                "max_wait_seconds": self._max_wait,
+            }
+
+
+_pools: Dict[ModelKey, WhisperModelPool] = {}
+_pools_lock = threading.Lock()
+_configured_sizes = dict(parse_model_config(WHISPER_MODELS))
+
+
+def get_model_pool(model_size: str = "base.en", compute_type: str = "default", cpu_threads: int = 0) -> WhisperModelPool:
+    """Return the process-wide pool for a model configuration, creating it if needed."""
+    key = (model_size, compute_type, cpu_threads)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = WhisperModelPool(key, _configured_sizes.get(key, WHISPER_DEFAULT_POOL_SIZE))
+            _pools[key] = pool
+        return pool
+
+
+def preload_models():
+    """Load every model listed in WHISPER_MODELS so the first request does not pay for it."""
+    for key in _configured_sizes:
+        get_model_pool(*key).warm()
+
+
+def configured_pool_capacity() -> int:
+    """Total number of model instances the configured pools may hold."""
+    return sum(_configured_sizes.values())
+
+
+def get_pool_stats() -> List[dict]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def iter_transcription(audio, model_size: str = "base.en", compute_type: str = "default", cpu_threads: int = 0, **transcribe_options):
+    """
+    Transcribe `audio` (a path or a 16 kHz float32 array) with a pooled model and
+    yield each segment as a dict as soon as it is decoded.
+    """
+    with get_model_pool(model_size, compute_type, cpu_threads).acquire() as model:
+        segments, _ = model.transcribe(audio, **transcribe_options)
+        for seg in segments:
+            yield {"start": seg.start, "end": seg.end, "text": seg.text}